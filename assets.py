@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Tuple
+
+from PIL import Image as ImageModule
+
+from encoders import EncodeResult
+
+
+@dataclass(frozen=True)
+class Asset:
+    sha256: str
+    size: int
+    width: int
+    height: int
+
+
+class AssetManifest:
+    """The hash, size and dimensions of each file published to TTS players.
+
+    Face URLs use the hash as their cache buster, so a sheet's URL only
+    changes when its contents do.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.assets: Dict[str, Asset] = {}
+        if self.path.exists():
+            self.assets = {
+                name: Asset(**asset)
+                for name, asset in json.loads(self.path.read_text()).items()
+            }
+
+    def record(self, result: EncodeResult, dimensions: Tuple[int,
+                                                             int]) -> Asset:
+        width, height = dimensions
+        asset = Asset(result.digest, result.size, width, height)
+        self.assets[self.name(result.path)] = asset
+        return asset
+
+    def get(self, path: Path) -> Asset:
+        name = self.name(path)
+        asset = self.assets.get(name)
+        if asset is None:
+            # Built before there was a manifest, so work it out from the file.
+            data = path.read_bytes()
+            with ImageModule.open(path) as image:
+                width, height = image.size
+            asset = Asset(hashlib.sha256(data).hexdigest(), len(data), width,
+                          height)
+            self.assets[name] = asset
+        return asset
+
+    def cache_buster(self, path: Path) -> str:
+        return self.get(path).sha256[:16]
+
+    def name(self, path: Path) -> str:
+        return str(Path(path).relative_to(self.path.parent))
+
+    def save(self) -> None:
+        # Forget about anything that's no longer being published.
+        assets = {
+            name: asdict(asset)
+            for name, asset in sorted(self.assets.items())
+            if (self.path.parent / name).exists()
+        }
+        self.path.write_text(json.dumps(assets, indent=2))
@@ -0,0 +1,679 @@
+"""Benchmarks for the card generation pipeline.
+
+Run `python bench.py --help` to see what can be measured.
+"""
+from __future__ import annotations
+
+import argparse
+import dataclasses
+import datetime
+import io
+import itertools
+import json
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+import openpyxl
+from PIL import ImageDraw
+
+import card
+import card_template
+import card_template_game_crafter
+import fonts
+import image_helper
+import tabletop_simulator
+import text_layout
+import util
+from assets import AssetManifest
+from deck import DECK_ROWS, Deck, create_tts_collection, load_spreadsheet
+from encoders import ENCODERS
+from main import prewarm_icons
+from snapshot import CardDatabase, Snapshot
+
+MACGUFFIN_EFFECT = (
+    'When an obstacle would be overcome, you may discard this MacGuffin to '
+    'instead return the obstacle to the top of the deck and draw two reward '
+    'cards, keeping one of them and giving the other to the player on your '
+    'left, who must then discard an element card of their choice. ')
+
+
+def timeit(func: Callable[[], object], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def legacy_text_wrap(text, font, max_width):
+    # util.text_wrap as it was, for comparison.
+    lines = []
+    if font.getsize(text)[0] <= max_width:
+        lines.append(text)
+    else:
+        words = text.split(' ')
+        i = 0
+        while i < len(words):
+            line = ''
+            while i < len(words) and font.getsize(line +
+                                                  words[i])[0] <= max_width:
+                line = line + words[i] + " "
+                i += 1
+            if not line:
+                line = words[i]
+                i += 1
+            lines.append(line)
+    return '\n'.join(lines)
+
+
+def bench_text_wrap(args) -> None:
+    template = card_template_game_crafter.PokerDeckMacguffinCardTemplate()
+    font = fonts.get_font(card_template.FONT_PATH, template.text_font_size)
+    ((x1, _), (x2, _)) = template.layout.text_box
+    max_width = (x2 - x1) - template.text_padding * 2
+    text = MACGUFFIN_EFFECT * args.paragraphs
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', DeprecationWarning)
+        legacy = timeit(lambda: legacy_text_wrap(text, font, max_width),
+                        args.repeat)
+    # The first call fills the word width cache, the rest reuse it.
+    cold = timeit(lambda: text_layout.wrap(text, font, max_width), 1)
+    warm = timeit(lambda: text_layout.wrap(text, font, max_width), args.repeat)
+
+    print(f'{len(text.split())} words, {args.repeat} runs')
+    print(f'  util.text_wrap:          {legacy * 1000:8.3f} ms')
+    print(f'  text_layout.wrap (cold): {cold * 1000:8.3f} ms')
+    print(f'  text_layout.wrap (warm): {warm * 1000:8.3f} ms'
+          f'  ({legacy / warm:.1f}x)')
+
+
+def synthetic_obstacles(count: int) -> List[card.Card]:
+    icons = sorted(image_helper.ICON_DIR.glob('*.svg'))
+    elements = [card.Element(icon.stem.title(), icon.name) for icon in icons]
+    return [
+        card.ObstacleCard(f'Obstacle {i}', MACGUFFIN_EFFECT, 1,
+                          [elements[i % len(elements)],
+                           elements[(i + 1) % len(elements)]])
+        for i in range(count)
+    ]
+
+
+def peak_rss_mib() -> float:
+    # ru_maxrss is in KiB on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def bench_sheet_memory(args) -> None:
+    if args.mode is None:
+        # Each mode runs in a fresh process so their peaks don't mix.
+        for mode in ('list', 'stream'):
+            subprocess.run([
+                sys.executable, __file__, 'sheet-memory', '--mode', mode,
+                '--cards', str(args.cards)
+            ],
+                           check=True)
+        return
+
+    cards = synthetic_obstacles(args.cards)
+    hidden = card.HiddenCard('???', '', 0).draw_game_crafter()
+    rows = image_helper.sheet_rows(len(cards))
+    before = peak_rss_mib()
+
+    start = time.perf_counter()
+    if args.mode == 'list':
+        # How Deck.create_subdeck_card_sheet used to do it.
+        images = [c.draw_game_crafter() for c in cards]
+        image_helper.create_card_sheet(images, hidden, 10, rows)
+    else:
+        images = (c.draw_game_crafter() for c in cards)
+        image_helper.create_card_sheet(images, hidden, 10, rows)
+    elapsed = time.perf_counter() - start
+
+    print(f'{args.mode:>6}: {len(cards)} cards in {elapsed:.2f} s, '
+          f'peak RSS {peak_rss_mib():.1f} MiB '
+          f'(+{peak_rss_mib() - before:.1f} MiB while building the sheet)')
+
+
+def synthetic_collection(cards: int, copies: int) -> tabletop_simulator.Collection:
+    decks = []
+    for deck_idx in range(max(1, cards // 1000)):
+        deck = tabletop_simulator.Deck(f'Deck {deck_idx}', 'Synthetic deck')
+        for card_idx in range(min(cards, 1000) // copies):
+            card_id = deck_idx * 1000 + card_idx
+            tts_card = tabletop_simulator.Card(f'Card {card_id}',
+                                               MACGUFFIN_EFFECT, card_id)
+            tts_card.Tags = ['Card', 'MacGuffin', 'Overcome', 'Before']
+            for _ in range(copies):
+                deck.DeckIDs.append(card_id)
+                deck.ContainedObjects.append(tts_card)
+        decks.append(deck)
+    return tabletop_simulator.Collection(decks)
+
+
+def bench_tts_json(args) -> None:
+    collection = synthetic_collection(args.cards, args.copies)
+    cards = sum(len(deck.ContainedObjects) for deck in collection.ObjectStates)
+
+    def old():
+        out = io.StringIO()
+        json.dump(collection.to_json(), out, indent=2)
+        return out.getvalue()
+
+    def new(indent):
+        out = io.StringIO()
+        tabletop_simulator.write_json(collection, out, indent=indent)
+        return out.getvalue()
+
+    if old() != new(2):
+        raise AssertionError('write_json output differs from json.dump')
+
+    print(f'{cards} cards ({args.copies} copies of each), {args.repeat} runs')
+    baseline = timeit(old, args.repeat)
+    print(f'  asdict + json.dump:         {baseline * 1000:8.1f} ms')
+    for name, indent in (('indented', 2), ('compact', None)):
+        seconds = timeit(lambda: new(indent), args.repeat)
+        print(f'  write_json ({name + "):":<10}     {seconds * 1000:8.1f} ms'
+              f'  ({baseline / seconds:.1f}x, {len(new(indent)) / 2**20:.1f} MiB)')
+
+
+ROLE_TEXT = ('You may reroll one die per turn while you are in the same room '
+             'as another member of the away team.')
+
+
+def synthetic_workbook(path: Path, elements: int, obstacles: int,
+                       rewards: int, roles: int, macguffins: int) -> None:
+    """Write an xlsx laid out the way the loaders in card.py expect."""
+    wb = openpyxl.Workbook()
+    wb.remove(wb.active)
+
+    icons = sorted(image_helper.ICON_DIR.glob('*.svg'))
+    names = []
+    ws = wb.create_sheet('Elements')
+    ws.append(['Name', 'Image', 'Count'])
+    for i in range(elements):
+        icon = icons[i % len(icons)]
+        name = icon.stem.title()
+        if i >= len(icons):
+            name += f' {i // len(icons) + 1}'
+        names.append(name)
+        ws.append([name, icon.name, 3])
+
+    ws = wb.create_sheet('Obstacles')
+    ws.append(['Element', 'Element', 'Name', 'Description', 'Count'])
+    for i in range(obstacles):
+        ws.append([
+            names[i % elements], names[(i + 1) % elements], f'Obstacle {i}',
+            MACGUFFIN_EFFECT[:40 + i % 80], 1 + i % 2
+        ])
+
+    ws = wb.create_sheet('Rewards')
+    ws.append(['Name', 'Description', 'Count', 'Element', 'Element', 'Element'])
+    for i in range(rewards):
+        # A mix of named and unnamed, with and without text, one to three
+        # elements, like the real sheet.
+        ws.append([
+            f'Reward {i}' if i % 2 else None,
+            'Draw a card.' if i % 3 == 0 else None, 2,
+            *[names[(i + j) % elements] for j in range(1 + i % 3)]
+        ])
+
+    ws = wb.create_sheet('SpeciesRolesTrait')
+    ws.append(['Species', 'Description', 'Trait', 'Description', None, 'Role',
+               'Description'])
+    for i in range(roles):
+        ws.append([None] * 5 + [f'Role {i}', ROLE_TEXT])
+
+    ws = wb.create_sheet('MacGuffins')
+    ws.append(['Name', 'Effect', 'Power Rating', "Ryan's Rating", 'Trigger',
+               'Before/After'])
+    for i in range(macguffins):
+        ws.append([
+            f'MacGuffin {i}', MACGUFFIN_EFFECT[:60 + (i * 37) % 300], i % 3 - 1,
+            ('Good', 'Fine', 'Bad')[i % 3], ('Overcome', 'Draw', 'Discard')[i % 3],
+            ('Before', 'After', None)[i % 3]
+        ])
+
+    ws = wb.create_sheet('Decks')
+    ws.append(['Name', 'Description', 'Back Image', 'Card Class'])
+    for name, card_class in [('Elements', 'ElementCard'),
+                             ('Obstacles', 'ObstacleCard'),
+                             ('Rewards', 'RewardCard'), ('Roles', 'RoleCard'),
+                             ('MacGuffins', 'MacguffinCard')]:
+        ws.append([name, f'{name} deck', f'https://example.com/{name}.png',
+                   card_class])
+
+    wb.save(str(path))
+
+
+class Phases:
+    """Total time and number of calls for each named phase."""
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = defaultdict(float)
+        self.calls: Dict[str, int] = defaultdict(int)
+
+    @contextmanager
+    def __call__(self, *names: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            for name in names:
+                self.seconds[name] += elapsed
+                self.calls[name] += 1
+
+    def to_json(self) -> Dict[str, Dict[str, float]]:
+        return {
+            name: {
+                'seconds': self.seconds[name],
+                'calls': self.calls[name]
+            }
+            for name in self.seconds
+        }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'],
+                              capture_output=True,
+                              text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_pipeline(spreadsheet: Path, out_dir: Path) -> Dict[str, object]:
+    # Rendering is done without the render and icon caches, which are off
+    # unless main.py turns them on, so each run measures the real work.
+    phases = Phases()
+    templates = Phases()
+    encoder = ENCODERS['default']
+
+    # Each sheet is parsed in the first phase to read it.
+    with util.Workbook(spreadsheet) as workbook:
+        with phases('load_card_types'):
+            card_types = card.Card.load_card_types(workbook)
+        with phases('read_decks'):
+            deck_rows = DECK_ROWS.read(workbook)
+    with phases('build_decks'):
+        decks = Deck.from_database(
+            CardDatabase(card.Element.loaded(), card_types, deck_rows))
+
+    with phases('prewarm_icons'):
+        prewarm_icons(decks)
+
+    for deck in decks.values():
+        for c in deck.cards:
+            if c.deck_count == 0:
+                continue
+            template = c.game_crafter_template()
+            with phases('draw'), templates(type(template).__name__):
+                image = template.draw(c)
+            with phases('save', 'save_game_crafter'):
+                encoder.save(image, out_dir / 'game_crafter.png')
+
+    # The paths create_tts_deck looks the sheets up by.
+    assets = AssetManifest(Path('generated') / 'assets.json')
+    for deck in decks.values():
+        for subdeck_idx, subdeck in enumerate(deck.subdecks(), start=10):
+            images = []
+            for c in subdeck:
+                if c is None:
+                    continue
+                template = c.tts_template()
+                with phases('draw'), templates(type(template).__name__):
+                    images.append(template.draw(c))
+            rows = image_helper.sheet_rows(len(images))
+            with phases('create_card_sheet'):
+                sheet = image_helper.create_card_sheet(images,
+                                                       deck.hidden_card, 10,
+                                                       rows)
+            with phases('save', 'save_card_sheet'):
+                result = encoder.save(sheet, out_dir / 'sheet.png')
+            assets.record(
+                dataclasses.replace(result,
+                                    path=deck.sheet_path(subdeck_idx,
+                                                         encoder)),
+                sheet.size)
+
+    with phases('create_tts_deck'):
+        collection = create_tts_collection(decks.values(), assets, encoder)
+    with phases('json_dump'), (out_dir / 'all.json').open('w') as f:
+        tabletop_simulator.write_json(collection, f, indent=2)
+
+    return {
+        'cards': {name: len(deck.cards) for name, deck in decks.items()},
+        'phases': phases.to_json(),
+        'templates': templates.to_json(),
+    }
+
+
+def print_phases(results: Dict[str, object],
+                 baseline: Optional[Dict[str, object]]) -> None:
+    for section in ('phases', 'templates'):
+        print(f'{section.title()}:')
+        for name, phase in results[section].items():
+            line = (f'  {name:<32} {phase["seconds"] * 1000:10.1f} ms '
+                    f'{phase["calls"]:6} calls')
+            before = (baseline or {}).get(section, {}).get(name)
+            if before:
+                change = phase['seconds'] / before['seconds'] - 1
+                line += f'  {change:+7.1%}'
+            print(line)
+
+
+def bench_pipeline(args) -> None:
+    counts = dict(elements=args.elements,
+                  obstacles=args.obstacles,
+                  rewards=args.rewards,
+                  roles=args.roles,
+                  macguffins=args.macguffins)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        out_dir = Path(tmp_dir)
+        spreadsheet = args.spreadsheet
+        if spreadsheet is None:
+            spreadsheet = out_dir / 'synthetic.xlsx'
+            synthetic_workbook(spreadsheet, **counts)
+        pipeline = run_pipeline(spreadsheet, out_dir)
+
+    results = {
+        'commit': git_commit(),
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'spreadsheet': str(args.spreadsheet) if args.spreadsheet else counts,
+        **pipeline,
+    }
+    baseline = None
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        print(f'Compared with {baseline["commit"]} ({baseline["date"]})')
+    print_phases(results, baseline)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+        print(f'Results written to {args.output}')
+
+
+def legacy_rows(workbook: util.Workbook, sheet_name: str, min_row: int = 1,
+                min_col: int = 1, max_col: Optional[int] = None):
+    # Workbook.rows as it was, for comparison.
+    for row in workbook.sheet(sheet_name)[min_row - 1:]:
+        if max_col is not None and len(row) < max_col:
+            row = row + (None, ) * (max_col - len(row))
+        yield row[min_col - 1:max_col]
+
+
+def legacy_load_card_types(workbook: util.Workbook) -> Dict[str, List[card.Card]]:
+    # The loaders in card.py as they were, before they had schemas.
+    card.ELEMENTS = elements = {}
+    for row in legacy_rows(workbook, 'Elements', min_row=2, max_col=2):
+        if row[0] is not None:
+            elements[row[0]] = card.Element(row[0], row[1])
+
+    element_cards = []
+    for row in legacy_rows(workbook, 'Elements', min_row=2, max_col=3):
+        element = card.Element.get(row[0])
+        if element is None:
+            continue
+        element_cards.append(
+            card.ElementCard(element.name, '', int(row[2]), element))
+
+    obstacles = []
+    for row in legacy_rows(workbook, 'Obstacles', min_row=2, max_col=5):
+        row_elements = [card.Element.get(value) for value in row[:2]]
+        if row_elements[0] is None:
+            continue
+        obstacles.append(
+            card.ObstacleCard(row[2], row[3], int(row[4]), row_elements))
+
+    rewards = []
+    for row in legacy_rows(workbook, 'Rewards', min_row=2):
+        row_elements = [card.Element.get(value) for value in row[3:]]
+        row_elements = [e for e in row_elements if e is not None]
+        if len(row_elements) == 0:
+            continue
+        name = row[0]
+        if name is None:
+            name = '/'.join(element.name for element in row_elements)
+        rewards.append(
+            card.RewardCard(name, row[1] or '', int(row[2]), row_elements))
+
+    roles = []
+    for row in legacy_rows(workbook, 'SpeciesRolesTrait', min_row=2,
+                           min_col=6, max_col=7):
+        if row[0] is not None:
+            roles.append(card.RoleCard(row[0], row[1] or '', 1))
+
+    macguffins = []
+    rows = legacy_rows(workbook, 'MacGuffins')
+    header = next(rows)
+    for values in rows:
+        row = dict(itertools.zip_longest(header, values, fillvalue=''))
+        if not (row['Name'] or '').strip() or not (row['Effect'] or '').strip():
+            continue
+        macguffins.append(
+            card.MacguffinCard(row['Name'], row['Effect'], 1,
+                               int(row['Power Rating'] or 0),
+                               (row["Ryan's Rating"] or '').split(','),
+                               row['Trigger'] or '', row['Before/After'] or ''))
+
+    return {
+        'ElementCard': element_cards,
+        'ObstacleCard': obstacles,
+        'RewardCard': rewards,
+        'RoleCard': roles,
+        'MacguffinCard': macguffins,
+        'HiddenCard': card.HiddenCard.load(workbook),
+    }
+
+
+def bench_rows(args) -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        spreadsheet = Path(tmp_dir) / 'synthetic.xlsx'
+        print(f'Writing {args.rows} rows to each sheet...')
+        synthetic_workbook(spreadsheet, 8, args.rows, args.rows, args.rows,
+                           args.rows)
+        with util.Workbook(spreadsheet) as workbook:
+            # Parsing the xlsx takes the same time either way, so get it out
+            # of the way first.
+            for sheet in ('Elements', 'Obstacles', 'Rewards',
+                          'SpeciesRolesTrait', 'MacGuffins', 'Decks'):
+                workbook.sheet(sheet)
+            print(workbook.report())
+
+            if (legacy_load_card_types(workbook) !=
+                    card.Card.load_card_types(workbook)):
+                raise AssertionError('schema loaders read different cards')
+
+            cards = sum(
+                len(cards)
+                for cards in card.Card.load_card_types(workbook).values())
+            print(f'{cards} cards, {args.repeat} runs')
+            baseline = timeit(lambda: legacy_load_card_types(workbook),
+                              args.repeat)
+            print(f'  indexed rows and dicts: {baseline * 1000:8.1f} ms')
+            seconds = timeit(lambda: card.Card.load_card_types(workbook),
+                             args.repeat)
+            print(f'  schemas:                {seconds * 1000:8.1f} ms'
+                  f'  ({baseline / seconds:.2f}x)')
+
+
+def bench_snapshot(args) -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        spreadsheet = Path(tmp_dir) / 'synthetic.xlsx'
+        print(f'Writing {args.rows} rows to each sheet...')
+        synthetic_workbook(spreadsheet, 8, args.rows, args.rows, args.rows,
+                           args.rows)
+        snapshot = Snapshot(Path(tmp_dir) / 'cards.pickle')
+
+        start = time.perf_counter()
+        cold = load_spreadsheet(spreadsheet, snapshot)
+        cold_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        warm = load_spreadsheet(spreadsheet, snapshot)
+        warm_seconds = time.perf_counter() - start
+
+        if ({name: deck.cards for name, deck in cold.items()} !=
+                {name: deck.cards for name, deck in warm.items()}):
+            raise AssertionError('the snapshot has different cards')
+        cards = sum(len(deck.cards) for deck in warm.values())
+        print(f'{cards} cards in decks')
+        print(f'  openpyxl, then saving the snapshot: '
+              f'{cold_seconds * 1000:10.1f} ms')
+        print(f'  from the snapshot:                  '
+              f'{warm_seconds * 1000:10.1f} ms'
+              f'  ({cold_seconds / warm_seconds:.0f}x)')
+
+
+@contextmanager
+def count_calls(owner, name: str) -> Iterator[List[int]]:
+    """Count the calls to `owner.name` made inside the `with` block."""
+    original = getattr(owner, name)
+    calls = [0]
+
+    def counted(*args, **kwargs):
+        calls[0] += 1
+        return original(*args, **kwargs)
+
+    setattr(owner, name, counted)
+    try:
+        yield calls
+    finally:
+        setattr(owner, name, original)
+
+
+def bench_draw(args) -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        spreadsheet = Path(tmp_dir) / 'synthetic.xlsx'
+        synthetic_workbook(spreadsheet, 8, args.cards, args.cards, args.cards,
+                           args.cards)
+        with util.Workbook(spreadsheet) as workbook:
+            decks = Deck.load_decks(workbook)
+    prewarm_icons(decks)
+
+    jobs = defaultdict(list)
+    for deck in decks.values():
+        for c in deck.cards:
+            for template in (c.tts_template(), c.game_crafter_template()):
+                jobs[type(template).__name__].append((template, c))
+    # Fill the fit cache and draw the backgrounds, as a build's first few
+    # cards would, so only the per-card work is measured.
+    for template_jobs in jobs.values():
+        for template, c in template_jobs:
+            template.draw(c)
+
+    print(f'{args.repeat} runs, per card:')
+    print(f'  {"template":<32} {"cards/s":>8} {"Draw()":>7} {"fonts":>6} '
+          f'{"peak KiB":>9}')
+    total_cards = total_seconds = 0
+    for name, template_jobs in sorted(jobs.items()):
+        lookups = fonts.FONT_CACHE.hits + fonts.FONT_CACHE.misses
+        with count_calls(ImageDraw, 'Draw') as draws:
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                for template, c in template_jobs:
+                    template.draw(c)
+            seconds = time.perf_counter() - start
+        cards = args.repeat * len(template_jobs)
+        lookups = fonts.FONT_CACHE.hits + fonts.FONT_CACHE.misses - lookups
+
+        # How much memory a draw needs beyond the finished card itself.
+        peak = 0
+        tracemalloc.start()
+        for template, c in template_jobs:
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            template.draw(c)
+            peak += tracemalloc.get_traced_memory()[1] - before
+        tracemalloc.stop()
+
+        total_cards += cards
+        total_seconds += seconds
+        print(f'  {name:<32} {cards / seconds:8.1f} {draws[0] / cards:7.2f} '
+              f'{lookups / cards:6.2f} {peak / len(template_jobs) / 1024:9.1f}')
+    print(f'  {"all":<32} {total_cards / total_seconds:8.1f}')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    subparsers = parser.add_subparsers(required=True)
+
+    text_wrap = subparsers.add_parser(
+        'text-wrap', help='wrap long MacGuffin effect text')
+    text_wrap.add_argument('--paragraphs', type=int, default=4)
+    text_wrap.add_argument('--repeat', type=int, default=100)
+    text_wrap.set_defaults(func=bench_text_wrap)
+
+    sheet_memory = subparsers.add_parser(
+        'sheet-memory',
+        help='peak memory of building a sheet of Game Crafter sized cards')
+    sheet_memory.add_argument('--cards', type=int, default=69)
+    sheet_memory.add_argument('--mode', choices=('list', 'stream'),
+                              help=argparse.SUPPRESS)
+    sheet_memory.set_defaults(func=bench_sheet_memory)
+
+    tts_json = subparsers.add_parser(
+        'tts-json', help='serialize a large Tabletop Simulator collection')
+    tts_json.add_argument('--cards', type=int, default=10000)
+    tts_json.add_argument('--copies', type=int, default=3)
+    tts_json.add_argument('--repeat', type=int, default=5)
+    tts_json.set_defaults(func=bench_tts_json)
+
+    draw = subparsers.add_parser(
+        'draw', help='draw every kind of card with every template')
+    draw.add_argument('--cards',
+                      type=int,
+                      default=12,
+                      help='rows of each card type in the synthetic sheet')
+    draw.add_argument('--repeat', type=int, default=5)
+    draw.set_defaults(func=bench_draw)
+
+
+    rows = subparsers.add_parser(
+        'rows', help='load the cards from a very long spreadsheet')
+    rows.add_argument('--rows', type=int, default=50000)
+    rows.add_argument('--repeat', type=int, default=5)
+    rows.set_defaults(func=bench_rows)
+
+    snapshot = subparsers.add_parser(
+        'snapshot',
+        help='load a very long spreadsheet, then load it again from its snapshot')
+    snapshot.add_argument('--rows', type=int, default=50000)
+    snapshot.set_defaults(func=bench_snapshot)
+
+    pipeline = subparsers.add_parser(
+        'pipeline',
+        help='time each phase of a build from a synthetic spreadsheet')
+    pipeline.add_argument('--elements', type=int, default=8)
+    pipeline.add_argument('--obstacles', type=int, default=45)
+    pipeline.add_argument('--rewards', type=int, default=36)
+    pipeline.add_argument('--roles', type=int, default=18)
+    pipeline.add_argument('--macguffins', type=int, default=65)
+    pipeline.add_argument('--spreadsheet',
+                          type=Path,
+                          help='time a real xlsx instead of a synthetic one')
+    pipeline.add_argument('-o',
+                          '--output',
+                          type=Path,
+                          help='write the results to this JSON file')
+    pipeline.add_argument('--baseline',
+                          type=Path,
+                          help='results from an earlier run to compare with')
+    pipeline.set_defaults(func=bench_pipeline)
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    args.func(args)
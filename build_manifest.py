@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import functools
+import hashlib
+import inspect
+import json
+from collections import Counter
+from pathlib import Path
+from types import CodeType, FunctionType, ModuleType
+from typing import Dict, Iterator, List, Tuple
+
+
+def fingerprint(*parts) -> str:
+    """Hash the reprs of everything an output is built from."""
+    return hashlib.sha256('\0'.join(map(repr, parts)).encode()).hexdigest()
+
+
+def code_key(code: CodeType) -> Tuple:
+    """What a function's code does, to fingerprint it by.
+
+    Code objects' reprs have their addresses in them, so the bytecode and
+    constants are used instead, including those of any nested functions and
+    comprehensions.
+    """
+    return (code.co_code, tuple(map(_const_key, code.co_consts)),
+            code.co_names)
+
+
+def _const_key(const):
+    if isinstance(const, CodeType):
+        return code_key(const)
+    if isinstance(const, frozenset):
+        # `x in {...}` makes one, and its order changes with the hash seed.
+        return tuple(sorted(map(repr, const)))
+    return const
+
+
+def _namespace_key(namespace: Dict[str, object], module: str,
+                   constants) -> Iterator[Tuple[str, object]]:
+    for name, value in sorted(namespace.items()):
+        if isinstance(value, (staticmethod, classmethod)):
+            value = value.__func__
+        elif isinstance(value, property):
+            value = value.fget
+        elif isinstance(value, functools.cached_property):
+            value = value.func
+        if isinstance(value, FunctionType) and value.__module__ == module:
+            # Past any decorators, like tracing.traced.
+            yield name, code_key(inspect.unwrap(value).__code__)
+        elif isinstance(value, type) and value.__module__ == module:
+            # Every plain value in a class, like a template's offsets.
+            yield name, tuple(
+                _namespace_key(vars(value), module,
+                               lambda name: not name.startswith('__')))
+        elif (isinstance(value, (bool, int, float, str, tuple)) and
+              constants(name)):
+            yield name, value
+
+
+def modules_key(*modules: ModuleType) -> Tuple:
+    """The code of every function and class defined in these modules, and
+    their constants.
+
+    Outputs drawn by that code are fingerprinted with this, so editing it
+    rebuilds them without anyone having to remember to bump a version.
+    """
+    return tuple((module.__name__,
+                  tuple(_namespace_key(vars(module), module.__name__,
+                                       str.isupper)))
+                 for module in modules)
+
+
+class BuildManifest:
+    """Remembers the inputs each output was last built from.
+
+    An output only needs rebuilding if it's missing, or if the fingerprint of
+    its inputs has changed since it was recorded.
+    """
+
+    def __init__(self, path: Path, force: bool = False):
+        self.path = Path(path)
+        self.outputs: Dict[str, str] = {}
+        self.built: List[Path] = []
+        self.skipped: List[Path] = []
+        # When forced, everything is rebuilt, but still recorded for next time.
+        if self.path.exists() and not force:
+            self.outputs = json.loads(self.path.read_text())
+
+    def is_current(self, output: Path, fingerprint: str) -> bool:
+        current = (self.outputs.get(str(output)) == fingerprint and
+                   output.exists())
+        if current:
+            self.skipped.append(output)
+        return current
+
+    def record(self, output: Path, fingerprint: str) -> None:
+        self.outputs[str(output)] = fingerprint
+        self.built.append(output)
+
+    def reset(self) -> None:
+        """Start counting what's built and skipped afresh."""
+        self.built = []
+        self.skipped = []
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(json.dumps(self.outputs, indent=2, sort_keys=True))
+
+    def report(self) -> str:
+        lines = [
+            f'{len(self.built)} outputs built, {len(self.skipped)} up to date'
+        ]
+        skipped = Counter(path.parent for path in self.skipped)
+        for directory, count in sorted(skipped.items()):
+            lines.append(f'  skipped {count} in {directory}')
+        return '\n'.join(lines)
+
+
+class MemoryManifest(BuildManifest):
+    """A manifest that's only kept for as long as the process runs."""
+
+    def __init__(self):
+        super().__init__(Path('/nonexistent'))
+
+    def save(self) -> None:
+        return
+
+
+class FullBuild(MemoryManifest):
+    """A manifest that considers everything out of date, and saves nothing."""
+
+    def is_current(self, output: Path, fingerprint: str) -> bool:
+        return False
@@ -1,16 +1,24 @@
 from __future__ import annotations
 
 from dataclasses import dataclass, field
-from typing import ContextManager, Dict, List, Tuple
+from typing import ClassVar, ContextManager, Dict, List, Tuple
 from pathlib import Path
 
-from util import spreadsheet, spreadsheet_as_dicts
-from card_template import CardTemplate, ImageOnlyCardTemplate, TextOnlyCardTemplate, MacguffinCardTemplate
+from util import Workbook
+from schema import Column, Schema, SchemaError
+from card_template import get_template, CardTemplate, ImageOnlyCardTemplate, TextOnlyCardTemplate, MacguffinCardTemplate
 from card_template_game_crafter import PokerDeckTemplate, PokerDeckImageOnlyTemplate, PokerDeckTextOnlyTemplate, PokerDeckMacguffinCardTemplate, SquareDeckTemplate, SquareDeckImageOnlyTemplate, CircleDeckTemplate
 import image_helper
+import render_cache
+import tracing
 
 ELEMENTS: Dict[str, Element] = {}
 
+ELEMENT_ROWS = Schema('Elements', (
+    Column('Name', 0),
+    Column('Image', 1),
+), skip=lambda row: row[0] is None)
+
 
 @dataclass
 class Element:
@@ -22,20 +30,24 @@ class Element:
         return image_helper.ICON_DIR / self.image_filename
 
     @classmethod
-    def load(cls, path: Path) -> List[Element]:
+    def load(cls, workbook: Workbook) -> List[Element]:
         global ELEMENTS
         ELEMENTS = {}
-        with spreadsheet(path) as wb:
-            for row in wb['Elements'].iter_rows(min_row=2, max_col=2):
-                name = row[0].value
-                if name is None:
-                    continue
-
-                image = row[1].value
-                e = Element(name, image)
-                ELEMENTS[e.name] = e
+        for name, image in ELEMENT_ROWS.read(workbook):
+            e = Element(name, image)
+            ELEMENTS[e.name] = e
         return ELEMENTS.values()
 
+    @classmethod
+    def loaded(cls) -> Dict[str, Element]:
+        return ELEMENTS
+
+    @classmethod
+    def restore(cls, elements: Dict[str, Element]) -> None:
+        """Put back the elements loaded by an earlier run."""
+        global ELEMENTS
+        ELEMENTS = elements
+
     @classmethod
     def get(cls, name: str) -> Optional[Element]:
         return ELEMENTS.get(name)
@@ -46,25 +58,27 @@ class Card:
     name: str
     description: str
     deck_count: int
+    # How generate_image lays out the icons: in a 'row' or a 'column'.
+    icon_layout: ClassVar[str] = 'row'
 
     def get_filename(self) -> str:
         filename = f'{self.__class__.__name__}{self.name}.png'
         return filename.replace('/', '')
 
     def tts_template(self) -> CardTemplate:
-        return CardTemplate()
+        return get_template(CardTemplate)
 
     def game_crafter_template(self) -> CardTemplate:
-        return PokerDeckTemplate()
+        return get_template(PokerDeckTemplate)
 
     def draw(self):
         return self.draw_tts()
 
     def draw_tts(self):
-        return self.tts_template().draw(self)
+        return render_cache.draw(self.tts_template(), self)
 
     def draw_game_crafter(self):
-        return self.game_crafter_template().draw(self)
+        return render_cache.draw(self.game_crafter_template(), self)
 
     def get_card_type(self) -> str:
         return self.__class__.__name__.replace('Card', '')
@@ -72,46 +86,76 @@ class Card:
     def get_tags(self) -> List[str]:
         return ['Card']
 
+    def get_icon_paths(self) -> List[Path]:
+        return []
+
     def generate_image(self, image: Image, bbox: BBox) -> None:
-        return
+        icons = self.get_icon_paths()
+        if icons:
+            image_helper.draw_icons(image, bbox, icons, self.icon_layout)
 
     @classmethod
-    def load_card_types(cls, path: Path) -> Dict[str, List[Card]]:
-        Element.load(path)
-        card_types = {}
-        for card_type in cls.__subclasses__():
-            card_types[card_type.__name__] = card_type.load(path)
+    def load_card_types(cls, workbook: Workbook) -> Dict[str, List[Card]]:
+        # Carry on after a bad sheet, to report the problems with all of them.
+        errors = []
+
+        def load(name: str, loader):
+            with tracing.span(f'{name}.load', 'load'):
+                try:
+                    return loader(workbook)
+                except SchemaError as e:
+                    errors.append(e)
+
+        load('Element', Element.load)
+        card_types = {
+            card_type.__name__: load(card_type.__name__, card_type.load)
+            for card_type in cls.__subclasses__()
+        }
+        if errors:
+            raise SchemaError.combine(errors)
         return card_types
 
 
+# The elements themselves are read without their counts, so that a bad count
+# doesn't stop the other sheets from finding their elements.
+ELEMENT_CARD_ROWS = Schema('Elements', (
+    Column('Name', 0),
+    Column('Count', 2, int),
+), skip=lambda row: row[0] is None)
+
+
 @dataclass
 class ElementCard(Card):
     element: Element
 
     @classmethod
-    def load(cls, path: Path) -> List[Card]:
+    def load(cls, workbook: Workbook) -> List[Card]:
         cards = []
-        with spreadsheet(path) as wb:
-            for row in wb['Elements'].iter_rows(min_row=2, max_col=3):
-                element = Element.get(row[0].value)
-                if element is None:
-                    continue
-                deck_count = int(row[2].value)
-                cards.append(ElementCard(element.name, '', deck_count, element))
+        for name, deck_count in ELEMENT_CARD_ROWS.read(workbook):
+            element = Element.get(name)
+            cards.append(ElementCard(element.name, '', deck_count, element))
         return cards
 
     def tts_template(self) -> CardTemplate:
-        return ImageOnlyCardTemplate()
+        return get_template(ImageOnlyCardTemplate)
 
     def game_crafter_template(self) -> CardTemplate:
-        return SquareDeckImageOnlyTemplate()
+        return get_template(SquareDeckImageOnlyTemplate)
 
     def get_tags(self) -> List[str]:
         return super().get_tags() + ['Element', self.element.name]
 
-    def generate_image(self, image: Image, bbox: BBox) -> None:
-        icons = [self.element.image_path]
-        image_helper.draw_image_row(image, bbox, icons)
+    def get_icon_paths(self) -> List[Path]:
+        return [self.element.image_path]
+
+
+OBSTACLE_ROWS = Schema('Obstacles', (
+    Column('Element', 0),
+    Column('Element', 1),
+    Column('Name', 2),
+    Column('Description', 3),
+    Column('Count', 4, int),
+), skip=lambda row: row[0] not in ELEMENTS)
 
 
 @dataclass
@@ -119,99 +163,104 @@ class ObstacleCard(Card):
     elements: List[Element]
 
     @classmethod
-    def load(cls, path: Path) -> List[Card]:
+    def load(cls, workbook: Workbook) -> List[Card]:
         cards = []
-        with spreadsheet(path) as wb:
-            for row in wb['Obstacles'].iter_rows(min_row=2, max_col=5):
-                elements = [Element.get(cell.value) for cell in row[:2]]
-                if elements[0] is None:
-                    continue
-                name = row[2].value
-                description = row[3].value
-                deck_count = int(row[4].value)
-                cards.append(ObstacleCard(name, description, deck_count, elements))
+        for (first, second, name, description,
+             deck_count) in OBSTACLE_ROWS.read(workbook):
+            elements = [Element.get(first), Element.get(second)]
+            cards.append(ObstacleCard(name, description, deck_count, elements))
         return cards
 
     def get_tags(self) -> List[str]:
         return (super().get_tags() + ['Obstacle'] +
                 [e.name for e in self.elements])
 
-    def generate_image(self, image: Image, bbox: BBox) -> None:
-        icons = [element.image_path for element in self.elements]
-        image_helper.draw_image_row(image, bbox, icons)
+    def get_icon_paths(self) -> List[Path]:
+        return [element.image_path for element in self.elements]
+
+
+REWARD_ROWS = Schema('Rewards', (
+    Column('Name', 0),
+    Column('Description', 1, default=''),
+    Column('Count', 2, int),
+    Column('Elements', 3, rest=True),
+), skip=lambda row: ELEMENTS.keys().isdisjoint(row[3]))
 
 
 @dataclass
 class RewardCard(Card):
     elements: List[Element]
+    icon_layout: ClassVar[str] = 'column'
 
     @classmethod
-    def load(cls, path: Path) -> List[Card]:
+    def load(cls, workbook: Workbook) -> List[Card]:
         cards = []
-        with spreadsheet(path) as wb:
-            for row in wb['Rewards'].iter_rows(min_row=2):
-                elements = [Element.get(cell.value) for cell in row[3:]]
-                elements = [e for e in elements if e is not None]
-                if len(elements) == 0:
-                    continue
-
-                name = row[0].value
-                description = row[1].value or ''
-                deck_count = int(row[2].value)
+        for (name, description, deck_count,
+             element_names) in REWARD_ROWS.read(workbook):
+            elements = [Element.get(value) for value in element_names]
+            elements = [e for e in elements if e is not None]
+            if len(elements) == 0:
+                continue
 
-                if name is None:
-                    name = '/'.join(element.name for element in elements)
+            if name is None:
+                name = '/'.join(element.name for element in elements)
 
-                cards.append(RewardCard(name, description, deck_count, elements))
+            cards.append(RewardCard(name, description, deck_count, elements))
         return cards
 
     def tts_template(self) -> CardTemplate:
         if self.description:
-            return CardTemplate()
-        return ImageOnlyCardTemplate()
+            return get_template(CardTemplate)
+        return get_template(ImageOnlyCardTemplate)
 
     def game_crafter_template(self) -> CardTemplate:
         if self.description:
-            return SquareDeckTemplate()
-        return SquareDeckImageOnlyTemplate()
+            return get_template(SquareDeckTemplate)
+        return get_template(SquareDeckImageOnlyTemplate)
 
     def get_tags(self) -> List[str]:
         return (super().get_tags() + ['Reward'] +
                 [e.name for e in self.elements])
 
-    def generate_image(self, image: Image, bbox: BBox) -> None:
-        icons = [element.image_path for element in self.elements]
-        image_helper.draw_image_column(image, bbox, icons)
+    def get_icon_paths(self) -> List[Path]:
+        return [element.image_path for element in self.elements]
+
+
+ROLE_ROWS = Schema('SpeciesRolesTrait', (
+    Column('Role', 5),
+    Column('Description', 6, default=''),
+), skip=lambda row: row[0] is None)
 
 
 @dataclass
 class RoleCard(Card):
     @classmethod
-    def load(cls, path: Path) -> List[Card]:
+    def load(cls, workbook: Workbook) -> List[Card]:
         cards = []
-        with spreadsheet(path) as wb:
-            for row in wb['SpeciesRolesTrait'].iter_rows(min_row=2,
-                                                         min_col=6,
-                                                         max_col=7):
-                name = row[0].value
-                if name is None:
-                    continue
-
-                description = row[1].value or ''
-                deck_count = 1
-
-                cards.append(RoleCard(name, description, deck_count))
+        for name, description in ROLE_ROWS.read(workbook):
+            deck_count = 1
+
+            cards.append(RoleCard(name, description, deck_count))
         return cards
 
     def game_crafter_template(self) -> CardTemplate:
-        return CircleDeckTemplate()
+        return get_template(CircleDeckTemplate)
 
     def get_tags(self) -> List[str]:
         return super().get_tags() + ['Role']
 
-    def generate_image(self, image: Image, bbox: BBox) -> None:
-        icons = [image_helper.ICON_DIR / 'role.svg']
-        image_helper.draw_image_row(image, bbox, icons)
+    def get_icon_paths(self) -> List[Path]:
+        return [image_helper.ICON_DIR / 'role.svg']
+
+
+MACGUFFIN_ROWS = Schema('MacGuffins', (
+    Column('Name'),
+    Column('Effect'),
+    Column('Power Rating', type=int, default=0),
+    Column("Ryan's Rating", default=''),
+    Column('Trigger', default=''),
+    Column('Before/After', default=''),
+), skip=lambda row: not (row[0] or '').strip() or not (row[1] or '').strip())
 
 
 @dataclass
@@ -222,29 +271,22 @@ class MacguffinCard(Card):
     trigger_type: str
 
     @classmethod
-    def load(cls, path: Path) -> List[Card]:
+    def load(cls, workbook: Workbook) -> List[Card]:
         cards = []
-        for row in spreadsheet_as_dicts(path, 'MacGuffins'):
-            if not (row['Name'] or '').strip() or not (row['Effect'] or '').strip():
-                continue
-
+        for (name, effect, power_rating, ryan_rating, trigger,
+             trigger_type) in MACGUFFIN_ROWS.read(workbook):
             deck_count = 1
-            power_rating = int(row['Power Rating'] or 0)
-            ryan_rating = (row["Ryan's Rating"] or '').split(',')
-
             cards.append(
-                MacguffinCard(row['Name'], row['Effect'], deck_count,
-                              power_rating,
-                              ryan_rating, row['Trigger'] or '',
-                              row['Before/After'] or ''))
+                MacguffinCard(name, effect, deck_count, power_rating,
+                              ryan_rating.split(','), trigger, trigger_type))
 
         return cards
 
     def tts_template(self) -> CardTemplate:
-        return MacguffinCardTemplate()
+        return get_template(MacguffinCardTemplate)
 
     def game_crafter_template(self) -> CardTemplate:
-        return PokerDeckMacguffinCardTemplate()
+        return get_template(PokerDeckMacguffinCardTemplate)
 
     def get_tags(self) -> List[str]:
         return super().get_tags() + [
@@ -257,12 +299,11 @@ class MacguffinCard(Card):
 @dataclass
 class HiddenCard(Card):
     @classmethod
-    def load(cls, path: Path) -> List[Card]:
+    def load(cls, workbook: Workbook) -> List[Card]:
         return [cls('???', '', 0)]
 
     def tts_template(self) -> CardTemplate:
-        return ImageOnlyCardTemplate()
+        return get_template(ImageOnlyCardTemplate)
 
-    def generate_image(self, image: Image, bbox: BBox) -> None:
-        icons = [image_helper.ICON_DIR / 'hidden.svg']
-        image_helper.draw_image_row(image, bbox, icons)
+    def get_icon_paths(self) -> List[Path]:
+        return [image_helper.ICON_DIR / 'hidden.svg']
@@ -1,21 +1,58 @@
 from __future__ import annotations
 
 from dataclasses import dataclass, field
-from typing import List, Tuple
+from functools import cached_property
+from pathlib import Path
+from typing import ClassVar, Dict, List, Set, Tuple, Type, TypeVar
 
 from PIL import Image, ImageDraw, ImageFont
 
+import fonts
 import image_helper
-from util import text_wrap
+import text_layout
+import tracing
 from typedefs import BBox
 
 FONT_PATH = '/usr/share/fonts/truetype/ubuntu/Ubuntu-R.ttf'
 
+T = TypeVar('T', bound='CardTemplate')
+
+
+@dataclass(frozen=True)
+class Layout:
+    """The geometry of a template, which is the same for every card."""
+    title_box: BBox
+    text_box: BBox
+    image_box: BBox
+    type_marker_offset: int
+
+
+@dataclass(frozen=True)
+class TemplateFonts:
+    """A template's fonts at their usual sizes, and how tall a line of each is."""
+    title: ImageFont
+    type: ImageFont
+    text: ImageFont
+    title_height: int
+    type_height: int
+
+
+@dataclass
+class RenderContext:
+    """What a card is drawn with, shared by all of the populate_* steps."""
+    image: Image
+    draw: ImageDraw
+    layout: Layout
+    fonts: TemplateFonts
+
 
 @dataclass
 class CardTemplate:
-    font: ImageFont = field(
-        default_factory=lambda: ImageFont.truetype(FONT_PATH))
+    # Whether the text and image boxes get a frame drawn around them.
+    has_text: ClassVar[bool] = True
+    has_image: ClassVar[bool] = True
+
+    font: ImageFont = field(default_factory=lambda: fonts.get_font(FONT_PATH))
 
     bg_colour: Tuple[int, int, int, int] = (255, 255, 255, 255)
     fg_colour: Tuple[int, int, int, int] = (0, 0, 0, 255)
@@ -40,6 +77,9 @@ class CardTemplate:
     text_font_size: int = 24
     text_padding: int = 8
 
+    def get_font(self, size: int) -> ImageFont:
+        return fonts.get_font(self.font.path, size)
+
     def get_x1(self) -> int:
         return self.inset
 
@@ -48,11 +88,11 @@ class CardTemplate:
 
     def get_text_height(self, font: ImageFont) -> int:
         # Use 'Q' since it's full height and has a descender
-        _, height = font.getsize('Q')
+        _, _, _, height = font.getbbox('Q')
         return height
 
     def get_text_width(self, font: ImageFont, text: str) -> int:
-        width, _ = font.getsize(text)
+        _, _, width, _ = font.getbbox(text)
         return width
 
     def draw_rect(self, draw: ImageDraw, bbox: BBox) -> None:
@@ -61,28 +101,25 @@ class CardTemplate:
                                outline=self.fg_colour,
                                width=self.rect_stroke_width)
 
-    def populate_title(self, draw: ImageDraw, title: str, bbox: BBox) -> None:
-        self.draw_rect(draw, bbox)
-
+    def populate_title(self, ctx: RenderContext, title: str) -> None:
+        bbox = ctx.layout.title_box
         ((x1, y1), (x2, _)) = bbox
-        font = self.font.font_variant(size=self.title_font_size)
         title_x = x1 + self.rect_radius + self.title_padding
         title_y = y1 + self.title_padding
 
         max_width = x2 - self.rect_radius - self.title_padding - title_x
-        font_adjust = 1
-        while self.get_text_width(font, title) > max_width:
-            font = self.font.font_variant(size=self.title_font_size - font_adjust)
-            font_adjust += 1
-
-        draw.text((title_x, title_y + font_adjust // 2),
-                  title,
-                  font=font,
-                  fill=self.fg_colour,
-                  anchor='la')
+        fit = text_layout.fit_line((type(self), bbox), title, self.font.path,
+                                   max_width, self.title_font_size)
+        font_adjust = self.title_font_size - fit.size + 1
+
+        ctx.draw.text((title_x, title_y + font_adjust // 2),
+                      title,
+                      font=self.get_font(fit.size),
+                      fill=self.fg_colour,
+                      anchor='la')
 
     def get_title_box(self) -> BBox:
-        font = self.font.font_variant(size=self.title_font_size)
+        font = self.get_font(self.title_font_size)
 
         title_box_height = self.get_text_height(font) + self.title_padding * 2
 
@@ -94,24 +131,22 @@ class CardTemplate:
         return ((x1, y1), (x2, y2))
 
     def get_type_marker_offset(self) -> int:
-        font = self.font.font_variant(size=self.type_font_size)
+        font = self.get_font(self.type_font_size)
         type_height = self.get_text_height(font)
         return type_height + self.type_padding * 2
 
     def populate_type_marker(self, draw: ImageDraw, card_type: str) -> None:
-        font = self.font.font_variant(size=self.type_font_size)
-
-        type_height = self.get_text_height(font)
+        type_height = self.template_fonts.type_height
         type_x = self.width - self.inset
         type_y = self.height - self.inset - type_height // 2 - self.type_padding
         draw.text((type_x, type_y),
                   card_type.upper(),
-                  font=font,
+                  font=self.template_fonts.type,
                   fill=self.fg_colour,
                   anchor='rm')
 
     def get_text_box(self) -> BBox:
-        font = self.font.font_variant(size=self.text_font_size)
+        font = self.get_font(self.text_font_size)
 
         text_offset = self.get_type_marker_offset()
 
@@ -126,21 +161,23 @@ class CardTemplate:
 
         return ((x1, y1), (x2, y2))
 
-    def populate_text(self, draw: ImageDraw, text: str, bbox: BBox) -> None:
-        self.draw_rect(draw, bbox)
-
+    def populate_text(self, ctx: RenderContext, text: str) -> None:
+        bbox = ctx.layout.text_box
         ((x1, y1), (x2, y2)) = bbox
-        font = self.font.font_variant(size=self.text_font_size)
         text_x = x1 + (x2 - x1) // 2
         text_y = y1 + (y2 - y1) // 2
         max_width = (x2 - x1) - self.text_padding * 2
+        max_height = (y2 - y1) - self.text_padding * 2
+
+        fit = text_layout.fit_text((type(self), bbox), text, self.font.path,
+                                   lambda font: max_width, max_height,
+                                   self.text_font_size)
 
-        draw.multiline_text((text_x, text_y),
-                            text_wrap(text, font, max_width),
-                            font=font,
-                            fill=self.fg_colour,
-                            anchor='mm',
-                            align='center')
+        text_layout.draw_text(ctx.draw, (text_x, text_y),
+                              fit.layout,
+                              font=self.get_font(fit.size),
+                              fill=self.fg_colour,
+                              anchor='mm')
 
     def get_image_box(self) -> BBox:
         text_bbox = self.get_text_box()
@@ -155,33 +192,88 @@ class CardTemplate:
         x2 = self.get_x2()
         return ((x1, y1), (x2, y2))
 
-    def populate_image(self, image: Image, card: Card, bbox: BBox) -> None:
-        draw = ImageDraw.Draw(image)
-        self.draw_rect(draw, bbox)
-
-        card.generate_image(image, bbox)
-
-    def draw(self, card: Card):
+    def populate_image(self, ctx: RenderContext, card: Card) -> None:
+        card.generate_image(ctx.image, ctx.layout.image_box)
+
+    def get_icon_paths(self, card: Card) -> List[Path]:
+        return card.get_icon_paths()
+
+    def get_icon_requests(self, card: Card) -> Set[Tuple[Path, int]]:
+        """The (icon, size) pairs that drawing `card` will rasterize."""
+        icons = card.get_icon_paths()
+        if not self.has_image or not icons:
+            return set()
+        size = image_helper.icon_size(card.icon_layout, self.layout.image_box,
+                                      len(icons))
+        return {(icon, size) for icon in icons}
+
+    @cached_property
+    def layout(self) -> Layout:
+        return Layout(title_box=self.get_title_box(),
+                      text_box=self.get_text_box(),
+                      image_box=self.get_image_box(),
+                      type_marker_offset=self.get_type_marker_offset())
+
+    @cached_property
+    def template_fonts(self) -> TemplateFonts:
+        title = self.get_font(self.title_font_size)
+        type_font = self.get_font(self.type_font_size)
+        return TemplateFonts(title=title,
+                             type=type_font,
+                             text=self.get_font(self.text_font_size),
+                             title_height=self.get_text_height(title),
+                             type_height=self.get_text_height(type_font))
+
+    @cached_property
+    def backgrounds(self) -> Dict[str, Image]:
+        return {}
+
+    def draw_background(self, card_type: str) -> Image:
+        """Draw everything that doesn't depend on the card, besides its type."""
         img = Image.new('RGBA', (self.width, self.height),
                         color=self.bg_colour)
         draw = ImageDraw.Draw(img)
 
-        self.populate_type_marker(draw, card.get_card_type())
+        self.populate_type_marker(draw, card_type)
 
-        text_bbox = self.get_text_box()
-        self.populate_text(draw, card.description, text_bbox)
+        self.draw_rect(draw, self.layout.title_box)
+        if self.has_text:
+            self.draw_rect(draw, self.layout.text_box)
+        if self.has_image:
+            self.draw_rect(draw, self.layout.image_box)
 
-        title_bbox = self.get_title_box()
-        self.populate_title(draw, card.name, title_bbox)
+        return img
 
-        image_bbox = self.get_image_box()
-        self.populate_image(img, card, image_bbox)
+    def get_background(self, card_type: str) -> Image:
+        background = self.backgrounds.get(card_type)
+        if background is None:
+            background = self.draw_background(card_type)
+            self.backgrounds[card_type] = background
+        return background
+
+    def new_context(self, card_type: str) -> RenderContext:
+        image = self.get_background(card_type).copy()
+        return RenderContext(image, ImageDraw.Draw(image), self.layout,
+                             self.template_fonts)
+
+    def populate(self, ctx: RenderContext, card: Card) -> None:
+        with tracing.span('populate_text', 'populate'):
+            self.populate_text(ctx, card.description)
+        with tracing.span('populate_title', 'populate'):
+            self.populate_title(ctx, card.name)
+        with tracing.span('populate_image', 'populate'):
+            self.populate_image(ctx, card)
 
-        return img
+    def draw(self, card: Card) -> Image:
+        ctx = self.new_context(card.get_card_type())
+        self.populate(ctx, card)
+        return ctx.image
 
 
 @dataclass
 class TextOnlyCardTemplate(CardTemplate):
+    has_image: ClassVar[bool] = False
+
     def get_text_box(self) -> BBox:
         _, (_, title_bottom_y) = self.get_title_box()
 
@@ -201,6 +293,8 @@ class TextOnlyCardTemplate(CardTemplate):
 
 @dataclass
 class ImageOnlyCardTemplate(CardTemplate):
+    has_text: ClassVar[bool] = False
+
     def populate_text(self, *args, **kwargs) -> None:
         return
 
@@ -218,14 +312,12 @@ class ImageOnlyCardTemplate(CardTemplate):
 
 @dataclass
 class MacguffinCardTemplate(TextOnlyCardTemplate):
-    def populate_trigger(self, image: Image, card: MacguffinCard) -> None:
-        draw = ImageDraw.Draw(image)
-
-        font = self.font.font_variant(size=self.type_font_size)
+    def populate_trigger(self, ctx: RenderContext, card: MacguffinCard) -> None:
+        font = ctx.fonts.type
 
         trigger_text = card.trigger.upper()
 
-        text_height = self.get_text_height(font)
+        text_height = ctx.fonts.type_height
         text_width = self.get_text_width(font, trigger_text)
 
         before_offset = 0
@@ -243,24 +335,23 @@ class MacguffinCardTemplate(TextOnlyCardTemplate):
         trigger_x = self.get_x1() + self.rect_radius + before_offset
         trigger_y = self.height - self.inset - text_height // 2 - self.type_padding
 
-        draw.text((trigger_x, trigger_y),
-                  trigger_text,
-                  font=font,
-                  fill=self.fg_colour,
-                  anchor='lm')
+        ctx.draw.text((trigger_x, trigger_y),
+                      trigger_text,
+                      font=font,
+                      fill=self.fg_colour,
+                      anchor='lm')
 
         if icon_size > 0:
             gear_icon = image_helper.svg2image(
                 image_helper.ICON_DIR / 'gear.svg', icon_size, icon_size)
             icon_x = self.get_x1() + self.rect_radius + icon_offset
             icon_y = trigger_y - icon_size // 2
-            image.paste(gear_icon, (icon_x, icon_y), gear_icon)
+            ctx.image.paste(gear_icon, (icon_x, icon_y), gear_icon)
 
-    def populate_rating(self, image: Image, card: MacguffinCard) -> None:
-        draw = ImageDraw.Draw(image)
-        font = self.font.font_variant(size=self.title_font_size)
+    def populate_rating(self, ctx: RenderContext, card: MacguffinCard) -> None:
+        font = ctx.fonts.title
 
-        ((x1, y1), (x2, y2)) = self.get_text_box()
+        ((x1, y1), (x2, y2)) = ctx.layout.text_box
 
         colour = (200, 200, 200, 255)
         text_colour = (0, 0, 0, 255)
@@ -274,7 +365,7 @@ class MacguffinCardTemplate(TextOnlyCardTemplate):
         if 'positive' in card.ryan_rating:
             colour = (0, 255, 0, 255)
 
-        diameter = self.get_text_height(font) + 2
+        diameter = ctx.fonts.title_height + 2
         offset = 8
 
         circle_x1 = x2 - diameter - offset
@@ -283,22 +374,67 @@ class MacguffinCardTemplate(TextOnlyCardTemplate):
         circle_x2 = x2 - offset
         circle_y2 = y1 + diameter + offset
 
-        draw.ellipse(((circle_x1, circle_y1), (circle_x2, circle_y2)),
-                     fill=colour)
+        ctx.draw.ellipse(((circle_x1, circle_y1), (circle_x2, circle_y2)),
+                         fill=colour)
 
         circle_x = (circle_x2 - circle_x1) // 2 + circle_x1
         circle_y = (circle_y2 - circle_y1) // 2 + circle_y1
 
-        draw.text((circle_x, circle_y),
-                  text,
-                  font=font,
-                  fill=text_colour,
-                  anchor='mm')
+        ctx.draw.text((circle_x, circle_y),
+                      text,
+                      font=font,
+                      fill=text_colour,
+                      anchor='mm')
 
-    def draw(self, card: Card) -> Image:
-        img = super().draw(card)
+    def get_icon_paths(self, card: Card) -> List[Path]:
+        return super().get_icon_paths(card) + [image_helper.ICON_DIR / 'gear.svg']
 
-        self.populate_trigger(img, card)
-        self.populate_rating(img, card)
+    def get_icon_requests(self, card: Card) -> Set[Tuple[Path, int]]:
+        requests = super().get_icon_requests(card)
+        if card.trigger_type.lower() in ('before', 'after'):
+            icon_size = self.template_fonts.type_height
+            requests.add((image_helper.ICON_DIR / 'gear.svg', icon_size))
+        return requests
 
-        return img
+    def populate(self, ctx: RenderContext, card: Card) -> None:
+        super().populate(ctx, card)
+
+        with tracing.span('populate_trigger', 'populate'):
+            self.populate_trigger(ctx, card)
+        with tracing.span('populate_rating', 'populate'):
+            self.populate_rating(ctx, card)
+
+
+class TemplateRegistry:
+    """Shares one instance of each template class across every card."""
+
+    def __init__(self):
+        self._templates: Dict[type, CardTemplate] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, template_class: Type[T]) -> T:
+        template = self._templates.get(template_class)
+        if template is None:
+            self.misses += 1
+            template = template_class()
+            self._templates[template_class] = template
+        else:
+            self.hits += 1
+        return template
+
+    def templates(self) -> List[CardTemplate]:
+        return list(self._templates.values())
+
+    def clear(self) -> None:
+        self._templates.clear()
+
+    def report(self) -> str:
+        return (f'{self.misses} templates created, {self.hits} reused')
+
+
+TEMPLATES = TemplateRegistry()
+
+
+def get_template(template_class: Type[T]) -> T:
+    return TEMPLATES.get(template_class)
@@ -1,12 +1,15 @@
 from dataclasses import dataclass
+from pathlib import Path
+from typing import ClassVar, List, Set, Tuple
 import math
 
 from PIL import Image, ImageDraw
 
 import image_helper
 from typedefs import BBox
-from card_template import CardTemplate
-from util import text_wrap
+from card_template import CardTemplate, RenderContext
+import text_layout
+import tracing
 
 @dataclass
 class PokerDeckTemplate(CardTemplate):
@@ -31,6 +34,8 @@ class PokerDeckTemplate(CardTemplate):
 
 @dataclass
 class PokerDeckTextOnlyTemplate(PokerDeckTemplate):
+    has_image: ClassVar[bool] = False
+
     def get_text_box(self) -> BBox:
         _, (_, title_bottom_y) = self.get_title_box()
 
@@ -50,6 +55,8 @@ class PokerDeckTextOnlyTemplate(PokerDeckTemplate):
 
 @dataclass
 class PokerDeckImageOnlyTemplate(PokerDeckTemplate):
+    has_text: ClassVar[bool] = False
+
     def populate_text(self, *args, **kwargs) -> None:
         return
 
@@ -88,6 +95,8 @@ class SquareDeckTemplate(CardTemplate):
 
 @dataclass
 class SquareDeckTextOnlyTemplate(SquareDeckTemplate):
+    has_image: ClassVar[bool] = False
+
     def get_text_box(self) -> BBox:
         _, (_, title_bottom_y) = self.get_title_box()
 
@@ -107,6 +116,8 @@ class SquareDeckTextOnlyTemplate(SquareDeckTemplate):
 
 @dataclass
 class SquareDeckImageOnlyTemplate(SquareDeckTemplate):
+    has_text: ClassVar[bool] = False
+
     def populate_text(self, *args, **kwargs) -> None:
         return
 
@@ -126,14 +137,12 @@ class SquareDeckImageOnlyTemplate(SquareDeckTemplate):
 
 @dataclass
 class PokerDeckMacguffinCardTemplate(PokerDeckTextOnlyTemplate):
-    def populate_trigger(self, image: Image, card: 'MacguffinCard') -> None:
-        draw = ImageDraw.Draw(image)
-
-        font = self.font.font_variant(size=self.type_font_size)
+    def populate_trigger(self, ctx: RenderContext, card: 'MacguffinCard') -> None:
+        font = ctx.fonts.type
 
         trigger_text = card.trigger.upper()
 
-        text_height = self.get_text_height(font)
+        text_height = ctx.fonts.type_height
         text_width = self.get_text_width(font, trigger_text)
 
         before_offset = 0
@@ -151,24 +160,23 @@ class PokerDeckMacguffinCardTemplate(PokerDeckTextOnlyTemplate):
         trigger_x = self.get_x1() + self.rect_radius + before_offset
         trigger_y = self.height - self.inset - text_height // 2 - self.type_padding
 
-        draw.text((trigger_x, trigger_y),
-                  trigger_text,
-                  font=font,
-                  fill=self.fg_colour,
-                  anchor='lm')
+        ctx.draw.text((trigger_x, trigger_y),
+                      trigger_text,
+                      font=font,
+                      fill=self.fg_colour,
+                      anchor='lm')
 
         if icon_size > 0:
             gear_icon = image_helper.svg2image(
                 image_helper.ICON_DIR / 'gear.svg', icon_size, icon_size)
             icon_x = self.get_x1() + self.rect_radius + icon_offset
             icon_y = trigger_y - icon_size // 2
-            image.paste(gear_icon, (icon_x, icon_y), gear_icon)
+            ctx.image.paste(gear_icon, (icon_x, icon_y), gear_icon)
 
-    def populate_rating(self, image: Image, card: 'MacguffinCard') -> None:
-        draw = ImageDraw.Draw(image)
-        font = self.font.font_variant(size=self.title_font_size)
+    def populate_rating(self, ctx: RenderContext, card: 'MacguffinCard') -> None:
+        font = ctx.fonts.title
 
-        ((x1, y1), (x2, y2)) = self.get_text_box()
+        ((x1, y1), (x2, y2)) = ctx.layout.text_box
 
         colour = (200, 200, 200, 255)
         text_colour = (0, 0, 0, 255)
@@ -182,7 +190,7 @@ class PokerDeckMacguffinCardTemplate(PokerDeckTextOnlyTemplate):
         if 'positive' in card.ryan_rating:
             colour = (0, 255, 0, 255)
 
-        diameter = self.get_text_height(font) + 2
+        diameter = ctx.fonts.title_height + 2
         offset = 8
 
         circle_x1 = x2 - diameter - offset
@@ -191,25 +199,35 @@ class PokerDeckMacguffinCardTemplate(PokerDeckTextOnlyTemplate):
         circle_x2 = x2 - offset
         circle_y2 = y1 + diameter + offset
 
-        draw.ellipse(((circle_x1, circle_y1), (circle_x2, circle_y2)),
-                     fill=colour)
+        ctx.draw.ellipse(((circle_x1, circle_y1), (circle_x2, circle_y2)),
+                         fill=colour)
 
         circle_x = (circle_x2 - circle_x1) // 2 + circle_x1
         circle_y = (circle_y2 - circle_y1) // 2 + circle_y1
 
-        draw.text((circle_x, circle_y),
-                  text,
-                  font=font,
-                  fill=text_colour,
-                  anchor='mm')
+        ctx.draw.text((circle_x, circle_y),
+                      text,
+                      font=font,
+                      fill=text_colour,
+                      anchor='mm')
 
-    def draw(self, card: 'Card') -> Image:
-        img = super().draw(card)
+    def get_icon_paths(self, card: 'Card') -> List[Path]:
+        return super().get_icon_paths(card) + [image_helper.ICON_DIR / 'gear.svg']
 
-        self.populate_trigger(img, card)
-        self.populate_rating(img, card)
+    def get_icon_requests(self, card: 'Card') -> Set[Tuple[Path, int]]:
+        requests = super().get_icon_requests(card)
+        if card.trigger_type.lower() in ('before', 'after'):
+            icon_size = self.template_fonts.type_height
+            requests.add((image_helper.ICON_DIR / 'gear.svg', icon_size))
+        return requests
 
-        return img
+    def populate(self, ctx: RenderContext, card: 'Card') -> None:
+        super().populate(ctx, card)
+
+        with tracing.span('populate_trigger', 'populate'):
+            self.populate_trigger(ctx, card)
+        with tracing.span('populate_rating', 'populate'):
+            self.populate_rating(ctx, card)
 
 
 
@@ -234,53 +252,50 @@ class CircleDeckTemplate(CardTemplate):
     text_padding: int = CardTemplate.text_padding * 2
 
 
-    def draw(self, card: 'Card'):
+    def get_card_box(self) -> BBox:
+        return ((self.inset, self.inset), (self.width - self.inset, self.height - self.inset))
+
+    def get_title_box(self) -> BBox:
+        return self.get_card_box()
+
+    def get_text_box(self) -> BBox:
+        return self.get_card_box()
+
+    def draw_background(self, card_type: str) -> Image:
         img = Image.new('RGBA', (self.width, self.height),
                         color=self.bg_colour)
         draw = ImageDraw.Draw(img)
 
-        card_bbox = ((self.inset, self.inset), (self.width - self.inset, self.height - self.inset))
-        draw.ellipse(card_bbox,
+        draw.ellipse(self.get_card_box(),
                      outline=self.fg_colour, width=self.rect_stroke_width)
 
-
-        self.populate_text(draw, card.description, card_bbox)
-
-        self.populate_title(draw, card.name, card_bbox)
-
-        image_bbox = self.get_image_box()
-        self.populate_image(img, card, image_bbox)
-
         return img
 
-    def populate_text(self, draw: ImageDraw, text: str, bbox: BBox) -> None:
+    def populate_text(self, ctx: RenderContext, text: str) -> None:
+        bbox = ctx.layout.text_box
         ((x1, y1), (x2, y2)) = bbox
         center_y = y2 - (y2 - y1) // 2
-        font = self.font.font_variant(size=self.text_font_size)
         text_x = x1 + (x2 - x1) // 2
         text_y = y2 - (y2 - y1) // 2
         width = (x2 - x1) - self.text_padding * 2
 
         circle_radius = width // 2
         dist_from_center = text_y - center_y
-        font_height = self.get_text_height(font)
-
-        def max_width(line_num):
-            y = dist_from_center + font_height * (line_num + 1)
-            if y > circle_radius:
-                return 0
-            return math.sqrt(circle_radius**2 - y**2) * 2
-
-        draw.multiline_text((text_x, text_y),
-                            text_wrap(text, font, max_width),
-                            font=font,
-                            fill=self.fg_colour,
-                            anchor='ma',
-                            align='center')
-
-    def populate_title(self, draw: ImageDraw, title: str, bbox: BBox) -> None:
+
+        fit = text_layout.fit_text(
+            (type(self), 'text', bbox), text, self.font.path,
+            self.circle_line_widths(dist_from_center, circle_radius),
+            math.inf, self.text_font_size)
+
+        text_layout.draw_text(ctx.draw, (text_x, text_y),
+                              fit.layout,
+                              font=self.get_font(fit.size),
+                              fill=self.fg_colour,
+                              anchor='ma')
+
+    def populate_title(self, ctx: RenderContext, title: str) -> None:
+        bbox = ctx.layout.title_box
         ((x1, y1), (x2, y2)) = bbox
-        font = self.font.font_variant(size=self.title_font_size)
         title_x = x2 - (x2 - x1) // 2
         title_y = y1 + (y2 - y1) // 3
 
@@ -288,20 +303,33 @@ class CircleDeckTemplate(CardTemplate):
 
         circle_radius = (x2 - x1) // 2 - self.title_padding * 2
         dist_from_center = title_y - center_y
-        font_height = self.get_text_height(font)
 
-        def max_width(line_num):
-            y = dist_from_center + font_height * (line_num + 1)
-            if y > circle_radius:
-                return 0
-            return math.sqrt(circle_radius**2 - y**2) * 2
+        fit = text_layout.fit_text(
+            (type(self), 'title', bbox), title, self.font.path,
+            self.circle_line_widths(dist_from_center, circle_radius),
+            math.inf, self.title_font_size)
+
+        text_layout.draw_text(ctx.draw, (title_x, title_y),
+                              fit.layout,
+                              font=self.get_font(fit.size),
+                              fill=self.fg_colour,
+                              anchor='ma')
+
+    def circle_line_widths(self, dist_from_center: int, circle_radius: int):
+        """Line widths for text inside the card's circle, for a given font."""
+
+        def max_width_for(font):
+            font_height = self.get_text_height(font)
+
+            def max_width(line_num):
+                y = dist_from_center + font_height * (line_num + 1)
+                if y > circle_radius:
+                    return 0
+                return math.sqrt(circle_radius**2 - y**2) * 2
+
+            return max_width
 
-        draw.multiline_text((title_x, title_y),
-                            text_wrap(title, font, max_width),
-                            font=font,
-                            fill=self.fg_colour,
-                            anchor='ma',
-                            align='center')
+        return max_width_for
 
     def get_image_box(self) -> BBox:
         x1 = self.get_x1()
@@ -310,5 +338,5 @@ class CircleDeckTemplate(CardTemplate):
         y2 = y1 + (self.height - self.inset) // 3
         return ((x1, y1), (x2, y2))
 
-    def populate_image(self, image: Image, card: 'Card', bbox: BBox) -> None:
-        card.generate_image(image, bbox)
+    def populate_image(self, ctx: RenderContext, card: 'Card') -> None:
+        card.generate_image(ctx.image, ctx.layout.image_box)
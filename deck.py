@@ -1,22 +1,49 @@
 from __future__ import annotations
 
 import re
-import math
-import json
-import time
+import hashlib
+import sys
+from contextlib import nullcontext
 from dataclasses import dataclass
-from typing import List, Iterable, Dict
+from functools import cached_property, lru_cache
+from typing import List, Iterable, Dict, Optional, Tuple
 from pathlib import Path
+from types import ModuleType
 
-from card import Card, MacguffinCard
+from card import Card, Element, MacguffinCard
 import tabletop_simulator
 import util
 import image_helper
+from render_pool import RenderPool, SERIAL
+import encoders
+from encoders import ENCODERS, EncodeResult, Encoder
+from build_manifest import BuildManifest, FullBuild, fingerprint, modules_key
+from assets import AssetManifest
+from pipeline import Pipeline, Stage
+from output_sink import OutputSink
+from schema import Column, Schema
+from snapshot import CardDatabase, Snapshot
+import render_cache
+import tracing
 
 from PIL.Image import Image
 
-BASE_FACE_URL = 'https://raw.githubusercontent.com/rcfox/AwayTeamCards/master/generated/{deck}.png?{cache_buster}'
+BASE_FACE_URL = 'https://raw.githubusercontent.com/rcfox/AwayTeamCards/master/generated/{deck}{extension}?{cache_buster}'
 GENERATED_PATH = Path('generated')
+ASSET_MANIFEST_PATH = GENERATED_PATH / 'assets.json'
+
+DECK_ROWS = Schema('Decks', (
+    Column('Name'),
+    Column('Description'),
+    Column('Back Image'),
+    Column('Card Class'),
+), skip=lambda row: row[0] is None)
+
+
+@lru_cache(maxsize=None)
+def output_code(*modules: ModuleType) -> str:
+    """A fingerprint of this module's code, and of `modules`'."""
+    return fingerprint(modules_key(sys.modules[__name__], *modules))
 
 
 @dataclass
@@ -28,19 +55,35 @@ class Deck:
     cards: List[Card]
 
     @classmethod
-    def load_decks(self, path: Path) -> Dict[str, Deck]:
-        card_types = Card.load_card_types(path)
+    @tracing.traced('load')
+    def load_decks(self, workbook: util.Workbook) -> Dict[str, Deck]:
+        return Deck.from_database(read_database(workbook))
+
+    @classmethod
+    def from_database(cls, database: CardDatabase) -> Dict[str, Deck]:
+        card_types = database.card_types
         hidden = card_types['HiddenCard'][0].draw()
 
         decks = {}
-        for row in util.spreadsheet_as_dicts(path, 'Decks'):
-            deck = Deck(row['Name'], row['Description'], row['Back Image'],
-                        hidden, card_types[row['Card Class']])
+        for name, description, back_url, card_class in database.decks:
+            deck = Deck(name, description, back_url, hidden,
+                        card_types[card_class])
             decks[deck.name] = deck
         return decks
 
-    def generate_game_crafter_images(self):
+    @cached_property
+    def hidden_card_digest(self) -> str:
+        return hashlib.sha256(self.hidden_card.tobytes()).hexdigest()
+
+    def game_crafter_jobs(
+            self,
+            encoder: Encoder = ENCODERS['default'],
+            manifest: Optional[BuildManifest] = None
+    ) -> List[Tuple[Path, Card, str]]:
+        """The (path, card, fingerprint) of each Game Crafter image to build."""
+        manifest = manifest or FullBuild()
         image_path = Path('game_crafter')
+        jobs = []
         for card_idx, card in enumerate(self.cards):
             if card.deck_count == 0:
                 continue
@@ -53,39 +96,83 @@ class Deck:
                 else:
                     deck_name = 'Caveat'
             path = image_path/ deck_name / filename
-            path.parent.mkdir(parents=True, exist_ok=True)
-            print(path)
-            image = card.draw_game_crafter()
-            image.save(path)
+            card_fingerprint = fingerprint(
+                render_cache.card_key(card.game_crafter_template(), card),
+                encoder, output_code(encoders))
+            if manifest.is_current(path, card_fingerprint):
+                continue
+            jobs.append((path, card, card_fingerprint))
+        return jobs
 
     def subdecks(self) -> Iterable[Card]:
         yield from util.grouper(self.cards, 69)
 
-    def generate_card_sheets(self) -> List[Path]:
-        sheets = []
+    def sheet_fingerprint(self, subdeck: List[Card], encoder: Encoder) -> str:
+        cards = [card for card in subdeck if card]
+        return fingerprint(
+            [render_cache.card_key(card.tts_template(), card) for card in cards],
+            self.hidden_card_digest, encoder, output_code(encoders))
+
+    def sheet_path(self, subdeck_idx: int, encoder: Encoder) -> Path:
+        return GENERATED_PATH / f'{self.name}{subdeck_idx}{encoder.extension}'
+
+    def sheet_jobs(
+            self,
+            encoder: Encoder = ENCODERS['default'],
+            manifest: Optional[BuildManifest] = None
+    ) -> List[Tuple[Path, List[Card], str]]:
+        """The (path, cards, fingerprint) of each card sheet to build."""
+        manifest = manifest or FullBuild()
+        jobs = []
         for subdeck_idx, subdeck in enumerate(self.subdecks(), start=10):
-            image = self.create_subdeck_card_sheet(subdeck)
-            filename = f'{self.name}{subdeck_idx}.png'
-            path = GENERATED_PATH / filename
-            image.save(path)
-            sheets.append(path)
-        return sheets
-
-    def create_subdeck_card_sheet(self, subdeck: List[Card]) -> Image:
-        images = [card.draw() for card in subdeck if card]
-        rows = math.ceil(len(images) / 10)
-        return image_helper.create_card_sheet(images, self.hidden_card, 10,
-                                              rows)
-
-    def create_tts_deck(self) -> tabletop_simulator.Deck:
+            path = self.sheet_path(subdeck_idx, encoder)
+            sheet_fingerprint = self.sheet_fingerprint(subdeck, encoder)
+            if manifest.is_current(path, sheet_fingerprint):
+                continue
+            jobs.append((path, [card for card in subdeck if card],
+                         sheet_fingerprint))
+        return jobs
+
+    def create_subdeck_card_sheet(self,
+                                  subdeck: List[Card],
+                                  pool: RenderPool = SERIAL) -> Image:
+        cards = [card for card in subdeck if card]
+        rows = image_helper.sheet_rows(len(cards))
+        # Each card is pasted in and dropped as soon as it's drawn, rather
+        # than holding the whole subdeck's images at once.
+        return image_helper.create_card_sheet(pool.draw_tts(cards),
+                                              self.hidden_card, 10, rows)
+
+    def tts_fingerprint(self,
+                        assets: AssetManifest,
+                        encoder: Encoder = ENCODERS['default']) -> str:
+        """Everything that goes into this deck's part of the TTS JSON."""
+        cards = [(card.name, card.description, card.deck_count,
+                  card.get_tags()) for card in self.cards]
+        cache_busters = [
+            assets.cache_buster(self.sheet_path(subdeck_idx, encoder))
+            for subdeck_idx, _ in enumerate(self.subdecks(), start=10)
+        ]
+        return fingerprint(self.name, self.description, self.back_url, cards,
+                           cache_busters, encoder.extension,
+                           output_code(tabletop_simulator))
+
+    def create_tts_deck(
+            self,
+            assets: AssetManifest,
+            encoder: Encoder = ENCODERS['default']) -> tabletop_simulator.Deck:
         tts_deck = tabletop_simulator.Deck(self.name, self.description)
 
         for subdeck_idx, subdeck in enumerate(self.subdecks(), start=10):
             subdeck = [card for card in subdeck if card]
+            # The sheet's hash, so TTS only downloads it again if it changed.
+            cache_buster = assets.cache_buster(
+                self.sheet_path(subdeck_idx, encoder))
             face_url = BASE_FACE_URL.format(deck=f'{self.name}{subdeck_idx}',
-                                            cache_buster=time.time())
+                                            extension=encoder.extension,
+                                            cache_buster=cache_buster)
 
-            rows = math.ceil(len(subdeck) / 10)
+            rows = image_helper.sheet_rows(len(subdeck))
             tts_deck.CustomDeck[str(subdeck_idx)] = tabletop_simulator.SubDeck(
                 face_url, self.back_url, 10, rows)
 
@@ -98,3 +185,118 @@ class Deck:
                     tts_deck.ContainedObjects.append(tts_card)
 
         return tts_deck
+
+
+def create_tts_collection(
+        decks: Iterable[Deck],
+        assets: AssetManifest,
+        encoder: Encoder = ENCODERS['default']) -> tabletop_simulator.Collection:
+    tts_decks = [deck.create_tts_deck(assets, encoder) for deck in decks]
+    for i, tts_deck in enumerate(tts_decks):
+        tts_deck.Transform.posX = i * 2.5
+    return tabletop_simulator.Collection(tts_decks)
+
+
+def read_database(workbook: util.Workbook) -> CardDatabase:
+    card_types = Card.load_card_types(workbook)
+    return CardDatabase(Element.loaded(), card_types, DECK_ROWS.read(workbook))
+
+
+@tracing.traced('load')
+def load_spreadsheet(spreadsheet: Path,
+                     snapshot: Optional[Snapshot] = None) -> Dict[str, Deck]:
+    """The decks in a spreadsheet, from its snapshot if that's up to date."""
+    database = snapshot.load(spreadsheet) if snapshot else None
+    if database is None:
+        with util.Workbook(spreadsheet) as workbook:
+            database = read_database(workbook)
+        print(workbook.report())
+        if snapshot:
+            snapshot.save(spreadsheet, database)
+    else:
+        database.restore()
+    if snapshot:
+        print(f'Snapshot: {snapshot.report()}')
+    return Deck.from_database(database)
+
+
+def generate_game_crafter_images(
+        decks: Iterable[Deck],
+        pool: RenderPool = SERIAL,
+        encoder: Encoder = ENCODERS['default'],
+        manifest: Optional[BuildManifest] = None,
+        pipeline: Optional[Pipeline] = None,
+        sink: Optional[OutputSink] = None) -> List[EncodeResult]:
+    manifest = manifest or FullBuild()
+    pipeline = pipeline or Pipeline()
+    jobs = [job for deck in decks for job in deck.game_crafter_jobs(encoder, manifest)]
+
+    def render(job):
+        return job, job[1].draw_game_crafter()
+
+    def encode(rendered):
+        job, image = rendered
+        return job, encoder.encode(image)
+
+    def write(encoded):
+        (path, _, card_fingerprint), (data, seconds) = encoded
+        result = EncodeResult.of(path, data, seconds)
+        sink.write(result, data,
+                   lambda result: manifest.record(path, card_fingerprint))
+        return result
+
+    with nullcontext(sink) if sink else OutputSink() as sink:
+        sink.mkdirs(path for path, _, _ in jobs)
+        if pool.parallel:
+            # The render processes encode the images too.
+            cards = [card for _, card, _ in jobs]
+            return pipeline.run(zip(jobs,
+                                    pool.draw_game_crafter(cards, encoder)),
+                                Stage('write', write),
+                                source='render and encode')
+        return pipeline.run(jobs,
+                            Stage('render', render),
+                            Stage('encode', encode, workers=pipeline.threads),
+                            Stage('write', write),
+                            source='cards')
+
+
+def generate_card_sheets(
+        decks: Iterable[Deck],
+        assets: AssetManifest,
+        pool: RenderPool = SERIAL,
+        encoder: Encoder = ENCODERS['default'],
+        manifest: Optional[BuildManifest] = None,
+        pipeline: Optional[Pipeline] = None,
+        sink: Optional[OutputSink] = None) -> List[EncodeResult]:
+    manifest = manifest or FullBuild()
+    pipeline = pipeline or Pipeline()
+    jobs = [(deck, job) for deck in decks
+            for job in deck.sheet_jobs(encoder, manifest)]
+
+    def compose(deck_job):
+        deck, job = deck_job
+        return job, deck.create_subdeck_card_sheet(job[1], pool)
+
+    def encode(composed):
+        job, image = composed
+        return job, image.size, encoder.encode(image)
+
+    def write(encoded):
+        (path, _, sheet_fingerprint), size, (data, seconds) = encoded
+        result = EncodeResult.of(path, data, seconds)
+
+        def record(result):
+            assets.record(result, size)
+            manifest.record(path, sheet_fingerprint)
+
+        sink.write(result, data, record)
+        return result
+
+    with nullcontext(sink) if sink else OutputSink() as sink:
+        sink.mkdirs(path for _, (path, _, _) in jobs)
+        return pipeline.run(jobs,
+                            Stage('compose', compose),
+                            Stage('encode', encode, workers=pipeline.threads),
+                            Stage('write', write),
+                            source='subdecks')
@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import os
+import tempfile
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+
+@lru_cache(maxsize=None)
+def _file_digest(path: Path, mtime_ns: int, size: int) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def file_digest(path: Path) -> str:
+    """The SHA-256 of a file's contents, rehashed only when the file changes."""
+    path = Path(path)
+    stat = path.stat()
+    return _file_digest(path, stat.st_mtime_ns, stat.st_size)
+
+
+class DiskCache:
+    """A content-addressed store of files on disk, bounded in total size.
+
+    Entries are looked up by a hex digest key. Reading an entry bumps its
+    modification time, and once the cache grows past `max_bytes` the least
+    recently used entries are deleted. When refreshing, entries are never
+    read, only written afresh.
+    """
+
+    def __init__(self,
+                 path: Path,
+                 max_bytes: int,
+                 suffix: str = '.png',
+                 refresh: bool = False):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._size: Optional[int] = None
+
+    def __getstate__(self):
+        # Worker processes get their own counters.
+        state = self.__dict__.copy()
+        state.update(hits=0, misses=0, evictions=0, _size=None)
+        return state
+
+    def entry_path(self, key: str) -> Path:
+        return self.path / key[:2] / f'{key}{self.suffix}'
+
+    def entries(self):
+        return self.path.glob(f'*/*{self.suffix}')
+
+    def entry_stats(self) -> Iterator[Tuple[os.stat_result, Path]]:
+        # Other render processes share the directory, and may evict an entry
+        # between it being listed and it being looked at.
+        for entry in self.entries():
+            try:
+                yield entry.stat(), entry
+            except FileNotFoundError:
+                continue
+
+    def size(self) -> int:
+        if self._size is None:
+            self._size = sum(stat.st_size for stat, _ in self.entry_stats())
+        return self._size
+
+    def get(self, key: str) -> Optional[bytes]:
+        if self.refresh:
+            self.misses += 1
+            return None
+        path = self.entry_path(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:
+            # Including when another process evicted it after it was read.
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        path = self.entry_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        size = self.size()
+        try:
+            # Overwriting an entry doesn't add its size a second time.
+            size -= path.stat().st_size
+        except FileNotFoundError:
+            pass
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_name, path)
+
+        self._size = size + len(data)
+        if self._size > self.max_bytes:
+            # Leave some headroom so we aren't rescanning on every put.
+            self.prune(int(self.max_bytes * 0.9))
+
+    def prune(self, max_bytes: int) -> int:
+        """Delete the least recently used entries until under `max_bytes`."""
+        entries = sorted(self.entry_stats(),
+                         key=lambda stat_entry: stat_entry[0].st_mtime)
+        size = sum(stat.st_size for stat, _ in entries)
+        removed = 0
+        for stat, entry in entries:
+            if size <= max_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            size -= stat.st_size
+            removed += 1
+        self._size = size
+        self.evictions += removed
+        return removed
+
+    def take_counters(self) -> Tuple[int, int, int]:
+        """The hits, misses and evictions since last time, to send back from
+        a worker process."""
+        counters = (self.hits, self.misses, self.evictions)
+        self.hits = self.misses = self.evictions = 0
+        return counters
+
+    def add_counters(self, counters: Tuple[int, int, int]) -> None:
+        hits, misses, evictions = counters
+        self.hits += hits
+        self.misses += misses
+        self.evictions += evictions
+
+    def report(self) -> str:
+        # Worker processes may have added to it since it was last measured.
+        self._size = None
+        return (f'{self.path}: {self.hits} hits, {self.misses} misses, '
+                f'{self.evictions} evicted, {self.size() / 2**20:.1f} MiB')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Inspect or prune one of the caches kept under .cache.')
+    parser.add_argument('path',
+                        type=Path,
+                        help='cache directory, e.g. .cache/icons or .cache/renders')
+    parser.add_argument('--prune',
+                        type=float,
+                        metavar='MIB',
+                        help='delete the least recently used entries until the cache fits')
+    parser.add_argument('--clear',
+                        action='store_true',
+                        help='delete every entry')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    cache = DiskCache(args.path, max_bytes=0)
+    if args.clear:
+        args.prune = 0
+    if args.prune is not None:
+        removed = cache.prune(int(args.prune * 2**20))
+        print(f'Removed {removed} entries.')
+
+    entries = sorted(stat.st_mtime for stat, _ in cache.entry_stats())
+    print(f'{cache.path}: {len(entries)} entries, {cache.size() / 2**20:.1f} MiB')
+    if entries:
+        print(f'  least recently used: {time.ctime(entries[0])}')
+        print(f'  most recently used:  {time.ctime(entries[-1])}')
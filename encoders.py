@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import hashlib
+import time
+from dataclasses import dataclass, field
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, Tuple
+
+from PIL.Image import Image
+
+import tracing
+
+
+@dataclass(frozen=True)
+class EncodeResult:
+    path: Path
+    size: int
+    seconds: float
+    digest: str
+
+    @classmethod
+    def of(cls, path: Path, data: bytes, seconds: float) -> EncodeResult:
+        return cls(path, len(data), seconds, hashlib.sha256(data).hexdigest())
+
+    def __str__(self) -> str:
+        return (f'{self.path} ({self.size / 1024:.0f} KiB, '
+                f'encoded in {self.seconds * 1000:.0f} ms)')
+
+
+@dataclass(frozen=True)
+class Encoder:
+    format: str
+    extension: str
+    params: Dict[str, Any] = field(default_factory=dict)
+
+    @tracing.traced('save')
+    def encode(self, image: Image) -> Tuple[bytes, float]:
+        """Encode an image, returning the bytes and how long it took."""
+        start = time.perf_counter()
+        if self.format == 'JPEG' and image.mode != 'RGB':
+            image = image.convert('RGB')
+        out = BytesIO()
+        image.save(out, format=self.format, **self.params)
+        return out.getvalue(), time.perf_counter() - start
+
+    @tracing.traced('save')
+    def write(self, path: Path, data: bytes, seconds: float) -> EncodeResult:
+        path.write_bytes(data)
+        return EncodeResult.of(path, data, seconds)
+
+    def save(self, image: Image, path: Path) -> EncodeResult:
+        return self.write(path, *self.encode(image))
+
+
+ENCODERS = {
+    # What Image.save does for a .png path.
+    'default': Encoder('PNG', '.png'),
+    'fast': Encoder('PNG', '.png', {'compress_level': 1}),
+    'small': Encoder('PNG', '.png', {'optimize': True}),
+    'webp': Encoder('WEBP', '.webp', {'lossless': True}),
+    'jpeg': Encoder('JPEG', '.jpg', {'quality': 95, 'subsampling': 0}),
+}
+
+# The Game Crafter only takes PNGs.
+PNG_ENCODERS = [name for name, encoder in ENCODERS.items()
+                if encoder.format == 'PNG']
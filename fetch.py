@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+import requests
+
+CHUNK_SIZE = 64 * 1024
+
+
+@dataclass
+class FetchResult:
+    path: Path
+    digest: str
+    # False if the server said our copy was still current.
+    downloaded: bool
+    # Whether the contents differ from the copy we already had.
+    changed: bool
+
+
+class SpreadsheetCache:
+    """The last downloaded export, along with what we know about it.
+
+    Alongside the xlsx, a small JSON file keeps the server's validators
+    (ETag and Last-Modified) and the content hash. Whether anything needs
+    building from it is up to the build manifest, which also knows about the
+    icons, fonts and options the outputs were built with.
+    """
+
+    def __init__(self, cache_dir: Path, name: str = 'spreadsheet'):
+        self.path = Path(cache_dir) / f'{name}.xlsx'
+        self.meta_path = Path(cache_dir) / f'{name}.json'
+        self.meta: Dict[str, Optional[str]] = {}
+        if self.meta_path.exists() and self.path.exists():
+            self.meta = json.loads(self.meta_path.read_text())
+
+    def save(self) -> None:
+        self.meta_path.write_text(json.dumps(self.meta, indent=2))
+
+    def conditional_headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.meta.get('etag'):
+            headers['If-None-Match'] = self.meta['etag']
+        if self.meta.get('last_modified'):
+            headers['If-Modified-Since'] = self.meta['last_modified']
+        return headers
+
+    def fetch(self, url: str, session: Optional[requests.Session] = None,
+              timeout: float = 60) -> FetchResult:
+        session = session or requests.Session()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        with session.get(url,
+                         headers=self.conditional_headers(),
+                         stream=True,
+                         timeout=timeout) as r:
+            if r.status_code == 304:
+                return FetchResult(self.path, self.meta['sha256'], False,
+                                   False)
+            r.raise_for_status()
+
+            # Stream into a temporary file next to the cached copy, so a failed
+            # download never clobbers the last good one.
+            sha256 = hashlib.sha256()
+            fd, tmp_name = tempfile.mkstemp(dir=self.path.parent,
+                                            suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    for chunk in r.iter_content(CHUNK_SIZE):
+                        sha256.update(chunk)
+                        f.write(chunk)
+                digest = sha256.hexdigest()
+                changed = digest != self.meta.get('sha256')
+                if changed:
+                    os.replace(tmp_name, self.path)
+                else:
+                    # Leave the copy we have alone, so its modification time
+                    # still says when it last really changed.
+                    os.unlink(tmp_name)
+            except BaseException:
+                os.unlink(tmp_name)
+                raise
+
+            self.meta.update(etag=r.headers.get('ETag'),
+                             last_modified=r.headers.get('Last-Modified'),
+                             sha256=digest)
+            self.save()
+            return FetchResult(self.path, digest, True, changed)
@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+from typing import Dict, Tuple
+
+from PIL import ImageFont
+from PIL.ImageFont import FreeTypeFont
+
+
+class FontCache:
+    """Loads each (font file, size) pair from disk once per process."""
+
+    def __init__(self):
+        self._fonts: Dict[Tuple[str, int], FreeTypeFont] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path: str, size: int) -> FreeTypeFont:
+        key = (str(path), size)
+        font = self._fonts.get(key)
+        if font is None:
+            self.misses += 1
+            font = ImageFont.truetype(key[0], size)
+            self._fonts[key] = font
+        else:
+            self.hits += 1
+        return font
+
+    def clear(self) -> None:
+        self._fonts.clear()
+
+    def report(self) -> str:
+        return (f'{self.misses} fonts loaded, {self.hits} loads saved')
+
+
+FONT_CACHE = FontCache()
+
+
+def get_font(path: str, size: int = 10) -> FreeTypeFont:
+    return FONT_CACHE.get(path, size)
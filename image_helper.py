@@ -1,25 +1,146 @@
-from functools import lru_cache
+import hashlib
+import math
+from collections import OrderedDict
 from io import BytesIO
 from pathlib import Path
-from typing import List
+from typing import Iterable, List, Optional, Tuple
 
-import cairosvg
 from PIL import Image as ImageModule
 from PIL.Image import Image
 
+from disk_cache import DiskCache, file_digest
+import tracing
 from typedefs import BBox
 
 ICON_DIR = Path('icons')
 
+# Rasterized icons kept between runs, keyed on the SVG contents and size.
+RASTER_CACHE: Optional[DiskCache] = None
+
+
+def configure_raster_cache(cache: Optional[DiskCache]) -> None:
+    global RASTER_CACHE
+    RASTER_CACHE = cache
+
+
+def raster_key(svg_path: Path, width: int, height: int) -> str:
+    key = f'{file_digest(svg_path)}:{width}x{height}'
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def rasterize_svg(svg_path: Path, width: int, height: int) -> Image:
+    key = None
+    if RASTER_CACHE is not None:
+        key = raster_key(svg_path, width, height)
+        data = RASTER_CACHE.get(key)
+        if data is not None:
+            return ImageModule.open(BytesIO(data)).convert('RGBA')
+
+    # Imported here so that fully cached builds never have to load cairo.
+    import cairosvg
 
-@lru_cache
-def svg2image(svg_path: Path, width: int, height: int) -> Image:
     out = BytesIO()
     cairosvg.svg2png(url=str(svg_path),
                      write_to=out,
                      parent_width=width,
                      parent_height=height)
-    return ImageModule.open(out)
+    if key is not None:
+        RASTER_CACHE.put(key, out.getvalue())
+    # Decode now, so the image is ready to use as its own paste mask.
+    return ImageModule.open(out).convert('RGBA')
+
+
+class IconCache:
+    """Rasterized icons, bounded by the total size of their pixel data.
+
+    The least recently used icons are dropped once `max_bytes` is exceeded.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._icons: OrderedDict[Tuple[Path, int, int], Image] = OrderedDict()
+
+    def get(self, svg_path: Path, width: int, height: int) -> Image:
+        key = (Path(svg_path), width, height)
+        icon = self._icons.get(key)
+        if icon is not None:
+            self.hits += 1
+            self._icons.move_to_end(key)
+            return icon
+
+        self.misses += 1
+        icon = rasterize_svg(svg_path, width, height)
+        self._icons[key] = icon
+        self.bytes += self.image_bytes(icon)
+        while self.bytes > self.max_bytes and len(self._icons) > 1:
+            _, evicted = self._icons.popitem(last=False)
+            self.bytes -= self.image_bytes(evicted)
+            self.evictions += 1
+        return icon
+
+    @staticmethod
+    def image_bytes(image: Image) -> int:
+        width, height = image.size
+        return width * height * len(image.getbands())
+
+    def discard(self, svg_paths: Iterable[Path]) -> int:
+        """Drop every size of these icons, e.g. once their SVGs have changed."""
+        svg_paths = {Path(path) for path in svg_paths}
+        stale = [key for key in self._icons if key[0] in svg_paths]
+        for key in stale:
+            self.bytes -= self.image_bytes(self._icons.pop(key))
+        return len(stale)
+
+    def clear(self) -> None:
+        self._icons.clear()
+        self.bytes = 0
+
+    def report(self) -> str:
+        return (f'{len(self._icons)} icons, {self.bytes / 2**20:.1f} MiB, '
+                f'{self.hits} hits, {self.misses} misses, '
+                f'{self.evictions} evicted')
+
+
+ICON_CACHE = IconCache(64 * 2**20)
+
+
+@tracing.traced('icon')
+def svg2image(svg_path: Path, width: int, height: int) -> Image:
+    return ICON_CACHE.get(svg_path, width, height)
+
+
+def prewarm(icons: Iterable[Tuple[Path, int]]) -> None:
+    """Rasterize square icons ahead of time, given (path, size) pairs."""
+    for svg_path, size in icons:
+        svg2image(svg_path, size, size)
+
+
+def column_icon_size(dest_area: BBox, count: int) -> int:
+    ((x1, y1), (x2, y2)) = dest_area
+    return min(x2 - x1, y2 - y1) // (count + 1)
+
+
+def row_icon_size(dest_area: BBox, count: int) -> int:
+    ((x1, y1), (x2, y2)) = dest_area
+    return min(x2 - x1, y2 - y1) // max(count, 2)
+
+
+def icon_size(layout: str, dest_area: BBox, count: int) -> int:
+    """How big each of `count` icons is drawn in a 'row' or a 'column'."""
+    if layout == 'column':
+        return column_icon_size(dest_area, count)
+    return row_icon_size(dest_area, count)
+
+
+def draw_icons(dest_image: Image, dest_area: BBox, images: List[Path],
+               layout: str) -> Image:
+    if layout == 'column':
+        return draw_image_column(dest_image, dest_area, images)
+    return draw_image_row(dest_image, dest_area, images)
 
 
 def draw_image_column(dest_image: Image, dest_area: BBox,
@@ -28,7 +149,7 @@ def draw_image_column(dest_image: Image, dest_area: BBox,
     width = x2 - x1
     height = y2 - y1
 
-    icon_size = min(width, height) // (len(column_images) + 1)
+    icon_size = column_icon_size(dest_area, len(column_images))
     icon_x = x1 + width // 2 - icon_size // 2
 
     y_step = (height - icon_size) // len(column_images)
@@ -52,7 +173,7 @@ def draw_image_row(dest_image: Image, dest_area: BBox,
     width = x2 - x1
     height = y2 - y1
 
-    icon_size = min(width, height) // max(len(row_images), 2)
+    icon_size = row_icon_size(dest_area, len(row_images))
     icon_y = y1 + height // 2 - icon_size // 2
 
     x_step = (width - icon_size) // len(row_images)
@@ -67,28 +188,97 @@ def draw_image_row(dest_image: Image, dest_area: BBox,
     return dest_image
 
 
-def create_card_sheet(images: List[Image], hidden_image: Image, columns: int,
-                      rows: int) -> Image:
-    if columns > 10:
-        raise ValueError('too many columns: max is 10')
-    if rows > 7:
-        raise ValueError('too many rows: max is 7')
-    if len(images) > rows * columns - 1:
-        raise ValueError(
-            'too many images: max is columns*rows, with one reserved for the hidden card'
-        )
-    if len(images) < 1:
-        raise ValueError('no images given')
-
-    card_width, card_height = images[0].size
-
-    sheet = ImageModule.new('RGB', (columns * card_width, rows * card_height))
-    for idx, image in enumerate(images):
-        x = (idx % columns) * card_width
-        y = (idx // columns) * card_height
-        sheet.paste(image, (x, y), image)
-
-    sheet.paste(hidden_image,
-                ((columns - 1) * card_width, (rows - 1) * card_height),
-                hidden_image)
-    return sheet
+# The largest grid Tabletop Simulator takes for a deck's card sheet.
+TTS_MAX_COLUMNS = 10
+TTS_MAX_ROWS = 7
+
+
+def is_opaque(image: Image) -> bool:
+    if image.mode == 'RGB':
+        return True
+    if image.mode != 'RGBA':
+        return False
+    low, _ = image.getchannel('A').getextrema()
+    return low == 255
+
+
+def to_rgb(image: Image) -> Image:
+    """Drop a card's alpha channel, the same as pasting it onto black would.
+
+    Cards are opaque, so this is normally just a conversion.
+    """
+    if image.mode == 'RGB':
+        return image
+    if is_opaque(image):
+        return image.convert('RGB')
+    flattened = ImageModule.new('RGB', image.size)
+    flattened.paste(image, mask=image)
+    return flattened
+
+
+def sheet_rows(cards: int, columns: int = TTS_MAX_COLUMNS) -> int:
+    """How many rows a sheet needs for `cards`, plus the hidden card."""
+    return math.ceil((cards + 1) / columns)
+
+
+class CardSheet:
+    """Builds a card sheet of any size one card at a time.
+
+    Each card is copied into its slot as soon as it's added, so the caller
+    doesn't need to keep every card image around until the sheet is done.
+    Opaque cards are copied straight in, without blending them through their
+    alpha channel. The last slot is reserved for the hidden card.
+    """
+
+    def __init__(self, columns: int, rows: int):
+        self.columns = columns
+        self.rows = rows
+        self.count = 0
+        self.card_size: Optional[Tuple[int, int]] = None
+        self.sheet: Optional[Image] = None
+
+    def add(self, image: Image) -> None:
+        if self.count >= self.rows * self.columns - 1:
+            raise ValueError(
+                'too many images: max is columns*rows, with one reserved for the hidden card'
+            )
+        if self.sheet is None:
+            self.card_size = image.size
+            card_width, card_height = image.size
+            self.sheet = ImageModule.new(
+                'RGB', (self.columns * card_width, self.rows * card_height))
+        self._copy(image, self.count)
+        self.count += 1
+
+    def _copy(self, image: Image, slot: int) -> None:
+        if image.size != self.card_size:
+            raise ValueError(f'card is {image.size}, not {self.card_size} '
+                             'like the rest of the sheet')
+        card_width, card_height = self.card_size
+        x = (slot % self.columns) * card_width
+        y = (slot // self.columns) * card_height
+        if is_opaque(image):
+            # Pasting RGBA into RGB without a mask just copies the colours.
+            self.sheet.paste(image, (x, y))
+        else:
+            self.sheet.paste(image, (x, y), image)
+
+    def finish(self, hidden_image: Image) -> Image:
+        if self.sheet is None:
+            raise ValueError('no images given')
+        self._copy(hidden_image, self.columns * self.rows - 1)
+        return self.sheet
+
+
+@tracing.traced('sheet')
+def create_card_sheet(images: Iterable[Image], hidden_image: Image,
+                      columns: int, rows: int) -> Image:
+    """Build a card sheet that fits in Tabletop Simulator's largest grid."""
+    if columns > TTS_MAX_COLUMNS:
+        raise ValueError(f'too many columns: max is {TTS_MAX_COLUMNS}')
+    if rows > TTS_MAX_ROWS:
+        raise ValueError(f'too many rows: max is {TTS_MAX_ROWS}')
+    sheet = CardSheet(columns, rows)
+    for image in images:
+        sheet.add(image)
+    return sheet.finish(hidden_image)
@@ -1,16 +1,30 @@
-import json
-import sys
+import argparse
 import tempfile
 from pathlib import Path
 from pprint import pprint
+from typing import Dict, List, Optional
 
-import requests
-
-from deck import Deck
+from deck import (ASSET_MANIFEST_PATH, Deck, create_tts_collection,
+                  generate_card_sheets, generate_game_crafter_images,
+                  load_spreadsheet)
+from assets import AssetManifest
 import card
+import card_template
+import fonts
 import image_helper
-import util
 import tabletop_simulator
+from render_pool import RenderPool
+from disk_cache import DiskCache
+from encoders import ENCODERS, PNG_ENCODERS, EncodeResult, Encoder
+from build_manifest import (BuildManifest, FullBuild, MemoryManifest,
+                            fingerprint)
+from fetch import SpreadsheetCache
+from pipeline import Pipeline
+from output_sink import OutputSink
+from snapshot import Snapshot
+import render_cache
+import tracing
+import watch
 
 SAVE_DIR = Path('generated')
 
@@ -21,36 +35,226 @@ def export_url(spreadsheet_id):
     return f'https://docs.google.com/spreadsheets/d/{spreadsheet_id}/export?format=xlsx'
 
 
-def main(spreadsheet: Path):
-    decks = Deck.load_decks(spreadsheet)
-
+def prewarm_icons(decks: Dict[str, Deck]) -> None:
+    # Done before the render workers are forked, so they start with these too.
+    icons = set()
     for deck in decks.values():
-        deck.generate_game_crafter_images()
+        for card in deck.cards:
+            icons |= card.tts_template().get_icon_requests(card)
+            icons |= card.game_crafter_template().get_icon_requests(card)
+    image_helper.prewarm(sorted(icons))
+
+
+def report_outputs(name: str, results: List[EncodeResult]) -> None:
+    size = sum(result.size for result in results)
+    seconds = sum(result.seconds for result in results)
+    print(f'{name}: {len(results)} files, {size / 2**20:.1f} MiB, '
+          f'{seconds:.2f} s encoding')
+
 
-    tts_decks = [deck.create_tts_deck() for deck in decks.values()]
-    for i, deck in enumerate(tts_decks):
-        deck.Transform.posX = i * 2.5
+def main(spreadsheet: Path,
+         pool: RenderPool,
+         sheet_encoder: Encoder = ENCODERS['default'],
+         game_crafter_encoder: Encoder = ENCODERS['default'],
+         manifest: Optional[BuildManifest] = None,
+         json_indent: Optional[int] = 2,
+         encode_threads: Optional[int] = None,
+         write_buffer: int = 64 * 2**20,
+         quiet: bool = False,
+         snapshot: Optional[Snapshot] = None):
+    manifest = manifest or FullBuild()
 
-    collection = tabletop_simulator.Collection(tts_decks)
+    decks = load_spreadsheet(spreadsheet, snapshot)
 
+    prewarm_icons(decks)
+
+    game_crafter_pipeline = Pipeline(encode_threads)
+    sheet_pipeline = Pipeline(encode_threads)
+    assets = AssetManifest(ASSET_MANIFEST_PATH)
+    # The render workers are started once the icons are warm.
+    with pool, OutputSink(max_bytes=write_buffer, quiet=quiet) as sink:
+        with tracing.span('generate_game_crafter_images'):
+            game_crafter_images = generate_game_crafter_images(
+                decks.values(), pool, game_crafter_encoder, manifest,
+                game_crafter_pipeline, sink)
+
+        with tracing.span('generate_card_sheets'):
+            sheets = generate_card_sheets(decks.values(), assets, pool,
+                                          sheet_encoder, manifest,
+                                          sheet_pipeline, sink)
+
+    # Written after the sheets, since their hashes are the cache busters.
     output_json = SAVE_DIR / 'all.json'
-    with output_json.open('w') as f:
-        json.dump(collection.to_json(), f, indent=2)
+    json_fingerprint = fingerprint([
+        deck.tts_fingerprint(assets, sheet_encoder) for deck in decks.values()
+    ], json_indent)
+    if not manifest.is_current(output_json, json_fingerprint):
+        collection = create_tts_collection(decks.values(), assets,
+                                           sheet_encoder)
+        with output_json.open('w') as f:
+            tabletop_simulator.write_json(collection, f, indent=json_indent)
+        manifest.record(output_json, json_fingerprint)
+    assets.save()
 
-    for deck in decks.values():
-        print(deck.name)
-        deck.generate_card_sheets()
+    manifest.save()
+    print(f'Build: {manifest.report()}')
+    print(f'Output: {sink.report()}')
+
+    report_outputs('Game Crafter images', game_crafter_images)
+    report_outputs('Card sheets', sheets)
+    print(f'Game Crafter pipeline:\n{game_crafter_pipeline.report()}')
+    print(f'Card sheet pipeline:\n{sheet_pipeline.report()}')
+    print(f'Fonts: {fonts.FONT_CACHE.report()}')
+    print(f'Templates: {card_template.TEMPLATES.report()}')
+    print(f'Icons: {image_helper.ICON_CACHE.report()}')
+    if render_cache.RENDER_CACHE is not None:
+        print(f'Render cache: {render_cache.RENDER_CACHE.report()}')
+    if image_helper.RASTER_CACHE is not None:
+        print(f'Icon cache: {image_helper.RASTER_CACHE.report()}')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Generate cards for the Away Team game, based on our spreadsheet.')
+    parser.add_argument('spreadsheet',
+                        nargs='?',
+                        type=Path,
+                        help='local xlsx to build from, instead of downloading it')
+    parser.add_argument('-j',
+                        '--workers',
+                        type=int,
+                        default=1,
+                        help='number of processes to render cards with (0 for one per CPU)')
+    parser.add_argument('--sheet-format',
+                        choices=ENCODERS,
+                        default='default',
+                        help='how to encode the TTS card sheets')
+    parser.add_argument('--game-crafter-format',
+                        choices=PNG_ENCODERS,
+                        default='default',
+                        help='how to encode the Game Crafter images')
+    parser.add_argument('--encode-threads',
+                        type=int,
+                        help='number of threads to encode images with while the next '
+                        'ones are rendered (default: up to 4)')
+    parser.add_argument('--write-buffer',
+                        type=int,
+                        default=64,
+                        help='most encoded images to hold in memory while they are '
+                        'written out, in MiB')
+    parser.add_argument('-q',
+                        '--quiet',
+                        action='store_true',
+                        help="don't print every file as it's written, just a summary")
+    parser.add_argument('--compact-json',
+                        action='store_true',
+                        help='write all.json without any indentation')
+    parser.add_argument('--trace',
+                        type=Path,
+                        help='write a Chrome trace of the build to this file, '
+                        'and print the slowest cards and templates')
+    parser.add_argument('--watch',
+                        action='store_true',
+                        help='keep running, and rebuild whatever the spreadsheet or icons '
+                        'changed every time they do')
+    parser.add_argument('--poll-interval',
+                        type=float,
+                        default=1.0,
+                        help='how often to check for changes with --watch, in seconds')
+    parser.add_argument('--cache-dir',
+                        type=Path,
+                        default=Path('.cache'),
+                        help='where to keep caches between runs')
+    parser.add_argument('--no-cache',
+                        action='store_true',
+                        help="don't read or write any caches on disk")
+    parser.add_argument('--force',
+                        action='store_true',
+                        help='rebuild everything from scratch, without reusing the build manifest, '
+                        'cached renders and icons, or the spreadsheet snapshot')
+    parser.add_argument('--render-cache-size',
+                        type=int,
+                        default=1024,
+                        help='maximum size of the rendered card cache, in MiB')
+    parser.add_argument('--icon-cache-size',
+                        type=int,
+                        default=256,
+                        help='maximum size of the rasterized icon cache, in MiB')
+    args = parser.parse_args()
+    if args.watch and not args.spreadsheet:
+        parser.error('--watch needs a local spreadsheet to watch')
+    return args
 
 
 if __name__ == '__main__':
-    if len(sys.argv) > 1:
-        spreadsheet = Path(sys.argv[1])
-        main(spreadsheet)
+    args = parse_args()
+    if not args.no_cache:
+        # With --force, nothing is reused, but the caches are still filled.
+        renders = DiskCache(args.cache_dir / 'renders',
+                            args.render_cache_size * 2**20,
+                            refresh=args.force)
+        renders.prune(renders.max_bytes)
+        render_cache.configure(renders)
+
+        icons = DiskCache(args.cache_dir / 'icons',
+                          args.icon_cache_size * 2**20,
+                          refresh=args.force)
+        icons.prune(icons.max_bytes)
+        image_helper.configure_raster_cache(icons)
+
+    if args.trace:
+        tracing.configure(tracing.Tracer())
+
+    options = dict(sheet_encoder=ENCODERS[args.sheet_format],
+                   game_crafter_encoder=ENCODERS[args.game_crafter_format],
+                   json_indent=None if args.compact_json else 2,
+                   encode_threads=args.encode_threads,
+                   write_buffer=args.write_buffer * 2**20,
+                   quiet=args.quiet)
+    if not args.no_cache:
+        options['manifest'] = BuildManifest(
+            args.cache_dir / 'build-manifest.json', force=args.force)
+        options['snapshot'] = Snapshot(args.cache_dir / 'cards.pickle',
+                                       force=args.force)
+
+    # Entered by each build, so its workers are forked afresh with that
+    # build's icons.
+    pool = RenderPool(args.workers)
+    if args.watch:
+        manifest = options.setdefault('manifest', MemoryManifest())
+
+        def build():
+            manifest.reset()
+            main(args.spreadsheet, pool, **options)
+
+        try:
+            watch.watch(
+                watch.Watcher(args.spreadsheet, interval=args.poll_interval),
+                build)
+        except KeyboardInterrupt:
+            pass
     else:
-        print(f'Downloading spreadsheet {SPREADSHEET_ID}.')
-        r = requests.get(export_url(SPREADSHEET_ID))
-        r.raise_for_status()
+        if args.spreadsheet:
+            main(args.spreadsheet, pool, **options)
+        elif args.no_cache:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                print(f'Downloading spreadsheet {SPREADSHEET_ID}.')
+                fetched = SpreadsheetCache(Path(tmp_dir)).fetch(
+                    export_url(SPREADSHEET_ID))
+                main(fetched.path, pool, **options)
+        else:
+            spreadsheets = SpreadsheetCache(args.cache_dir)
+            print(f'Downloading spreadsheet {SPREADSHEET_ID}.')
+            fetched = spreadsheets.fetch(export_url(SPREADSHEET_ID))
+            if not fetched.downloaded:
+                print('Spreadsheet not modified since the last download.')
+            elif not fetched.changed:
+                print('Downloaded spreadsheet is the same as the last one.')
+            # Even so, the icons or options may have changed. The build
+            # manifest skips whatever is still up to date.
+            main(fetched.path, pool, **options)
 
-        with tempfile.NamedTemporaryFile(suffix='.xlsx') as tmp_file:
-            tmp_file.write(r.content)
-            main(Path(tmp_file.name))
+    if tracing.TRACER is not None:
+        tracing.TRACER.save(args.trace)
+        print(tracing.TRACER.summary())
+        print(f'Trace written to {args.trace}')
@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import os
+import stat
+import tempfile
+import threading
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Set
+
+from encoders import EncodeResult
+import tracing
+
+# Read the first time a new file is written, see current_umask.
+_umask: Optional[int] = None
+_umask_lock = threading.Lock()
+
+
+class OutputSink:
+    """Writes output files in the background.
+
+    Files are written on a few threads, so a slow disk doesn't hold up
+    rendering, but only up to `max_bytes` of them are held in memory waiting
+    to be written. Each one is written to a temporary file next to it and
+    renamed over it, so nothing ever sees a half-written file.
+    """
+
+    def __init__(self,
+                 threads: int = 8,
+                 max_bytes: int = 64 * 2**20,
+                 quiet: bool = False):
+        self.max_bytes = max_bytes
+        self.quiet = quiet
+        self._executor = ThreadPoolExecutor(max_workers=threads,
+                                            thread_name_prefix='output')
+        self._futures: List[Future] = []
+        self._directories: Set[Path] = set()
+        self._in_flight = 0
+        self._condition = threading.Condition()
+        self._errors: List[BaseException] = []
+
+        self.written: List[EncodeResult] = []
+        self.peak_bytes = 0
+        # Before any output threads are started, in case it has to be set to
+        # be read.
+        current_umask()
+
+    def __enter__(self) -> OutputSink:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            # Don't hide the error with one from a write that was waiting.
+            self._executor.shutdown()
+
+    def mkdirs(self, paths: Iterable[Path]) -> None:
+        """Create the directories for all of these paths, once each."""
+        for directory in sorted({Path(path).parent for path in paths}):
+            if directory not in self._directories:
+                directory.mkdir(parents=True, exist_ok=True)
+                self._directories.add(directory)
+
+    def write(self,
+              result: EncodeResult,
+              data: bytes,
+              on_written: Optional[Callable[[EncodeResult], None]] = None
+              ) -> None:
+        """Queue `data` to be written to `result.path`.
+
+        Waits while too many bytes are already waiting to be written.
+        `on_written` is called from the writing thread once the file is in
+        place.
+        """
+        self.mkdirs([result.path])
+        with self._condition:
+            # Something always has to be let through, however big it is.
+            while (self._in_flight and
+                   self._in_flight + len(data) > self.max_bytes):
+                self._condition.wait()
+            self._raise_errors()
+            self._in_flight += len(data)
+            self.peak_bytes = max(self.peak_bytes, self._in_flight)
+        self._futures.append(
+            self._executor.submit(self._write, result, data, on_written))
+
+    def _write(self, result: EncodeResult, data: bytes,
+               on_written: Optional[Callable[[EncodeResult], None]]) -> None:
+        try:
+            with tracing.span('write', 'save', path=str(result.path)):
+                write_atomically(result.path, data)
+            if on_written is not None:
+                on_written(result)
+            if not self.quiet:
+                print(result)
+            self.written.append(result)
+        except BaseException as e:
+            self._errors.append(e)
+        finally:
+            with self._condition:
+                self._in_flight -= len(data)
+                self._condition.notify_all()
+
+    def flush(self) -> None:
+        """Wait for everything queued so far to be written."""
+        futures, self._futures = self._futures, []
+        for future in futures:
+            future.result()
+        self._raise_errors()
+
+    def close(self) -> None:
+        try:
+            self.flush()
+        finally:
+            self._executor.shutdown()
+
+    def _raise_errors(self) -> None:
+        if self._errors:
+            raise self._errors[0]
+
+    def report(self) -> str:
+        size = sum(result.size for result in self.written)
+        lines = [
+            f'{len(self.written)} files, {size / 2**20:.1f} MiB written, '
+            f'into {len(self._directories)} directories, '
+            f'{self.peak_bytes / 2**20:.1f} MiB most waiting to be written'
+        ]
+        # With quiet on, where everything went instead of every file.
+        if self.quiet:
+            written = Counter(result.path.parent for result in self.written)
+            for directory, count in sorted(written.items()):
+                lines.append(f'  wrote {count} in {directory}')
+        return '\n'.join(lines)
+
+
+def _read_umask() -> int:
+    # Linux reports it, which saves setting it to read it back.
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('Umask:'):
+                    return int(line.split()[1], 8)
+    except (OSError, ValueError):
+        pass
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return umask
+
+
+def current_umask() -> int:
+    """The process's umask, read once, and without changing it if possible."""
+    global _umask
+    with _umask_lock:
+        if _umask is None:
+            _umask = _read_umask()
+        return _umask
+
+
+def write_atomically(path: Path, data: bytes) -> None:
+    # mkstemp only lets the owner read temporary files, but these are outputs.
+    # They keep the mode of the file they replace, or get the usual one.
+    try:
+        mode = stat.S_IMODE(path.stat().st_mode)
+    except FileNotFoundError:
+        mode = 0o666 & ~current_umask()
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent,
+                                    prefix=f'.{path.name}.',
+                                    suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            os.fchmod(f.fileno(), mode)
+            f.write(data)
+        os.replace(tmp_name, path)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+# Tells a stage's threads that there's nothing more coming.
+_DONE = object()
+
+# How often a blocked thread checks whether another stage has failed.
+_POLL_SECONDS = 0.1
+
+
+class _Stopped(Exception):
+    pass
+
+
+@dataclass
+class StageStats:
+    items: int = 0
+    # Thread-seconds spent doing work, waiting for something to work on, and
+    # waiting for room in the next stage's queue.
+    busy: float = 0.0
+    starved: float = 0.0
+    blocked: float = 0.0
+    # Thread-seconds the stage was running for, across all of its threads.
+    capacity: float = 0.0
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, items: int, busy: float, starved: float,
+            blocked: float) -> None:
+        with self.lock:
+            self.items += items
+            self.busy += busy
+            self.starved += starved
+            self.blocked += blocked
+
+    @property
+    def utilisation(self) -> float:
+        return self.busy / self.capacity if self.capacity else 0.0
+
+
+@dataclass
+class Stage:
+    """One step of a pipeline, run on `workers` threads.
+
+    Only use more than one worker for steps that are safe to run
+    concurrently, and that release the GIL (like encoding and writing files).
+    """
+    name: str
+    func: Callable[[Any], Any]
+    workers: int = 1
+
+
+class Pipeline:
+    """Runs items through stages on threads, connected by bounded queues.
+
+    Each stage works on the next item while the later stages are still busy
+    with the ones before it. When a stage falls behind, its queue fills up and
+    the stages before it wait, so only a few items are ever in flight.
+    Utilisation is added up by stage name across every run.
+    """
+
+    def __init__(self, threads: Optional[int] = None, queue_size: int = 2):
+        # For the stages that can use more than one thread. Each of them may
+        # be holding a whole card sheet.
+        self.threads = threads or min(os.cpu_count() or 1, 4)
+        self.queue_size = queue_size
+        self.stats: Dict[str, StageStats] = {}
+
+    def run(self,
+            items: Iterable,
+            *stages: Stage,
+            source: str = 'source') -> List:
+        """Run every item through the stages, returning what the last one
+        returned for each, in the same order as the items."""
+        queues = [queue.Queue(self.queue_size) for _ in stages]
+        results: Dict[int, Any] = {}
+        errors: List[BaseException] = []
+        stop = threading.Event()
+        remaining = [stage.workers for stage in stages]
+        remaining_lock = threading.Lock()
+
+        def put(q: queue.Queue, item) -> float:
+            start = time.perf_counter()
+            while True:
+                if stop.is_set():
+                    raise _Stopped()
+                try:
+                    q.put(item, timeout=_POLL_SECONDS)
+                    return time.perf_counter() - start
+                except queue.Full:
+                    if stop.is_set():
+                        raise _Stopped()
+
+        def get(q: queue.Queue):
+            while True:
+                if stop.is_set():
+                    raise _Stopped()
+                try:
+                    return q.get(timeout=_POLL_SECONDS)
+                except queue.Empty:
+                    if stop.is_set():
+                        raise _Stopped()
+
+        def finish(stage_idx: int) -> None:
+            # The last thread out tells every thread of the next stage.
+            with remaining_lock:
+                remaining[stage_idx] -= 1
+                last = remaining[stage_idx] == 0
+            if last and stage_idx + 1 < len(stages):
+                for _ in range(stages[stage_idx + 1].workers):
+                    put(queues[stage_idx + 1], _DONE)
+
+        def feed() -> None:
+            stats = self.stats[source]
+            count = 0
+            busy = blocked = 0.0
+            try:
+                iterator = iter(items)
+                while True:
+                    start = time.perf_counter()
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        break
+                    busy += time.perf_counter() - start
+                    blocked += put(queues[0], (count, item))
+                    count += 1
+                for _ in range(stages[0].workers):
+                    put(queues[0], _DONE)
+            except _Stopped:
+                pass
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                stats.add(count, busy, 0.0, blocked)
+
+        def work(stage_idx: int) -> None:
+            stage = stages[stage_idx]
+            stats = self.stats[stage.name]
+            count = 0
+            busy = starved = blocked = 0.0
+            try:
+                while True:
+                    start = time.perf_counter()
+                    item = get(queues[stage_idx])
+                    starved += time.perf_counter() - start
+                    if item is _DONE:
+                        break
+                    idx, value = item
+                    start = time.perf_counter()
+                    value = stage.func(value)
+                    busy += time.perf_counter() - start
+                    count += 1
+                    if stage_idx + 1 < len(stages):
+                        blocked += put(queues[stage_idx + 1], (idx, value))
+                    else:
+                        results[idx] = value
+                finish(stage_idx)
+            except _Stopped:
+                pass
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                stats.add(count, busy, starved, blocked)
+
+        for name in [source] + [stage.name for stage in stages]:
+            self.stats.setdefault(name, StageStats())
+
+        threads = [threading.Thread(target=feed, name=f'pipeline-{source}')]
+        for stage_idx, stage in enumerate(stages):
+            threads += [
+                threading.Thread(target=work,
+                                 args=(stage_idx, ),
+                                 name=f'pipeline-{stage.name}-{i}')
+                for i in range(stage.workers)
+            ]
+
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        self.stats[source].capacity += elapsed
+        for stage in stages:
+            self.stats[stage.name].capacity += elapsed * stage.workers
+
+        if errors:
+            raise errors[0]
+        return [results[idx] for idx in sorted(results)]
+
+    def report(self) -> str:
+        lines = []
+        for name, stats in self.stats.items():
+            lines.append(
+                f'  {name}: {stats.items} items, {stats.busy:.2f} s busy '
+                f'({stats.utilisation:.0%}), {stats.starved:.2f} s waiting '
+                f'for work, {stats.blocked:.2f} s waiting on the next stage')
+        return '\n'.join(lines)
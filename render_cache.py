@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import dataclasses
+import hashlib
+from functools import lru_cache
+from io import BytesIO
+from typing import Optional
+
+import PIL
+from PIL import Image as ImageModule
+from PIL.Image import Image
+
+from build_manifest import fingerprint, modules_key
+from disk_cache import DiskCache, file_digest
+import tracing
+
+# The drawing code is part of the cache key, so this only needs bumping for
+# changes it can't see, like in how the cache itself stores images.
+CACHE_VERSION = 4
+
+RENDER_CACHE: Optional[DiskCache] = None
+
+
+def configure(cache: Optional[DiskCache]) -> None:
+    global RENDER_CACHE
+    RENDER_CACHE = cache
+
+
+@lru_cache(maxsize=None)
+def drawing_code() -> str:
+    """A fingerprint of all the code that draws cards."""
+    # Imported here, since they all draw through this module.
+    import card
+    import card_template
+    import card_template_game_crafter
+    import fonts
+    import image_helper
+    import text_layout
+    return fingerprint(
+        modules_key(card, card_template, card_template_game_crafter,
+                    image_helper, text_layout, fonts),
+        PIL.__version__)
+
+
+def card_key(template: CardTemplate, card: Card) -> str:
+    """Hash everything that goes into drawing `card` with `template`."""
+    template_fields = {
+        f.name: getattr(template, f.name)
+        for f in dataclasses.fields(template) if f.name != 'font'
+    }
+    parts = [
+        f'v{CACHE_VERSION}',
+        drawing_code(),
+        type(card).__qualname__,
+        repr(dataclasses.asdict(card)),
+        type(template).__qualname__,
+        repr(template_fields),
+        file_digest(template.font.path),
+    ]
+    parts.extend(file_digest(path) for path in template.get_icon_paths(card))
+    return hashlib.sha256('\0'.join(parts).encode()).hexdigest()
+
+
+def render(template: CardTemplate, card: Card) -> Image:
+    with tracing.span(type(template).__name__, 'card', card=card.name):
+        return template.draw(card)
+
+
+def draw(template: CardTemplate, card: Card) -> Image:
+    if RENDER_CACHE is None:
+        return render(template, card)
+
+    key = card_key(template, card)
+    data = RENDER_CACHE.get(key)
+    if data is not None:
+        image = ImageModule.open(BytesIO(data))
+        image.load()
+        return image
+
+    image = render(template, card)
+    out = BytesIO()
+    image.save(out, format='PNG', compress_level=1)
+    RENDER_CACHE.put(key, out.getvalue())
+    return image
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import os
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import partial
+from typing import Callable, Iterator, List, Optional, Tuple, TypeVar
+
+from PIL.Image import Image
+
+from disk_cache import DiskCache
+from encoders import Encoder
+
+from card import Card
+import image_helper
+import render_cache
+import tracing
+
+T = TypeVar('T')
+
+
+def init_worker(renders: Optional[DiskCache], icons: Optional[DiskCache],
+                trace: bool) -> None:
+    # Forked workers start with a copy of the parent's counts, which the
+    # parent already has, so only what they count from here on is sent back.
+    take_counters(renders)
+    take_counters(icons)
+    render_cache.configure(renders)
+    image_helper.configure_raster_cache(icons)
+    tracing.configure(tracing.Tracer() if trace else None)
+
+
+# What a worker sends back with each result: its trace spans, and the hits,
+# misses and evictions of its render and icon caches.
+WorkerStats = Tuple[List[tracing.Span], Optional[Tuple[int, int, int]],
+                    Optional[Tuple[int, int, int]]]
+
+
+def take_counters(cache: Optional[DiskCache]) -> Optional[Tuple[int, int, int]]:
+    return cache.take_counters() if cache is not None else None
+
+
+def worker_call(func: Callable[[Card], T], card: Card) -> Tuple[T, WorkerStats]:
+    # Everything the worker counted goes back with the result, to be added to
+    # the parent's trace and cache reports.
+    result = func(card)
+    spans = []
+    if tracing.TRACER is not None:
+        spans, tracing.TRACER.spans = tracing.TRACER.spans, []
+    return result, (spans, take_counters(render_cache.RENDER_CACHE),
+                    take_counters(image_helper.RASTER_CACHE))
+
+
+def draw_tts(card: Card) -> Image:
+    return card.draw()
+
+
+def draw_tts_rgb(card: Card) -> Image:
+    # Card sheets are RGB anyway, so the alpha channel is dropped before the
+    # image is sent back from the worker, rather than pickling it.
+    return image_helper.to_rgb(card.draw())
+
+
+def draw_game_crafter_encoded(encoder: Encoder,
+                              card: Card) -> Tuple[bytes, float]:
+    # Encoded in the worker, so the parent only has to write the bytes out.
+    return encoder.encode(card.draw_game_crafter())
+
+
+class RenderPool:
+    """Renders cards either in this process or across a pool of processes.
+
+    Results always come back in the same order as the cards that were given,
+    and are the same as drawing each card serially. The worker processes are
+    started when the pool is entered and stopped when it's exited, so each
+    build can enter it again with its own icons warm.
+    """
+
+    def __init__(self, workers: Optional[int] = 1):
+        self.workers = workers or os.cpu_count() or 1
+        self._executor: Optional[Executor] = None
+
+    def __enter__(self) -> RenderPool:
+        if self.workers > 1:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=init_worker,
+                initargs=(render_cache.RENDER_CACHE,
+                          image_helper.RASTER_CACHE,
+                          tracing.TRACER is not None))
+            # Start the workers now, while this is the only thread. Forking
+            # once the pipeline and output threads are running could copy a
+            # lock one of them holds, and deadlock the worker. With fork,
+            # the first task starts every worker at once.
+            self._executor.submit(int).result()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    @property
+    def parallel(self) -> bool:
+        return self._executor is not None
+
+    def map(self, func: Callable[[Card], T], cards: List[Card]) -> Iterator[T]:
+        if self._executor is None:
+            return map(func, cards)
+        return self._collecting_map(func, cards)
+
+    def _collecting_map(self, func: Callable[[Card], T],
+                        cards: List[Card]) -> Iterator[T]:
+        for result, (spans, renders, icons) in self._bounded_map(
+                partial(worker_call, func), cards):
+            if tracing.TRACER is not None:
+                tracing.TRACER.spans.extend(spans)
+            if renders is not None and render_cache.RENDER_CACHE is not None:
+                render_cache.RENDER_CACHE.add_counters(renders)
+            if icons is not None and image_helper.RASTER_CACHE is not None:
+                image_helper.RASTER_CACHE.add_counters(icons)
+            yield result
+
+    def _bounded_map(self, func: Callable[[Card], T],
+                     cards: List[Card]) -> Iterator[T]:
+        # Only keep a couple of cards per worker in flight, so finished
+        # images don't pile up faster than the caller consumes them.
+        pending = deque()
+        for card in cards:
+            pending.append(self._executor.submit(func, card))
+            if len(pending) >= self.workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def draw_tts(self, cards: List[Card]) -> Iterator[Image]:
+        if self._executor is None:
+            return self.map(draw_tts, cards)
+        return self.map(draw_tts_rgb, cards)
+
+    def draw_game_crafter(self, cards: List[Card],
+                          encoder: Encoder) -> Iterator[Tuple[bytes, float]]:
+        return self.map(partial(draw_game_crafter_encoded, encoder), cards)
+
+
+SERIAL = RenderPool(workers=1)
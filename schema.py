@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from build_manifest import code_key, fingerprint
+from util import Workbook
+
+# Every schema, in the order they were defined.
+SCHEMAS: List[Schema] = []
+
+
+class SchemaError(ValueError):
+    """Every cell of the spreadsheet that didn't fit its sheet's schema."""
+
+    def __init__(self, problems: List[str]):
+        self.problems = problems
+        super().__init__('The spreadsheet has problems:\n' +
+                         '\n'.join(f'  {problem}' for problem in problems))
+
+    @classmethod
+    def combine(cls, errors: List[SchemaError]) -> SchemaError:
+        return cls([problem for error in errors for problem in error.problems])
+
+
+@dataclass(frozen=True)
+class Column:
+    """One column of a sheet.
+
+    Found by its header unless it's given a position. Empty cells become
+    `default`, and anything that isn't already a `type` is converted to one.
+    A column with a `type` and no `default` can't have empty cells. With
+    `rest`, it's every column from its position on, as a tuple.
+    """
+    name: str
+    index: Optional[int] = None
+    type: Optional[Callable[[Any], Any]] = None
+    default: Any = None
+    rest: bool = False
+
+    def changes(self, values: List,
+                problems: List[Tuple[int, str]]) -> List[Tuple[int, Any]]:
+        """The (index, value) of each cell in this column that needs filling
+        in or converting.
+
+        The whole column is checked at once, and usually needs nothing doing
+        to it. Cells that can't be converted are added to `problems`, along
+        with their index.
+        """
+        if self.type is not None and set(map(type, values)) <= {self.type}:
+            return []
+        if self.type is None and None not in values and '' not in values:
+            return []
+
+        changes = []
+        for i, value in enumerate(values):
+            if value is None or value == '':
+                if self.default is None:
+                    problems.append((i, f'{self.name} is empty'))
+                changes.append((i, self.default))
+            elif self.type is not None and type(value) is not self.type:
+                try:
+                    changes.append((i, self.type(value)))
+                except (TypeError, ValueError) as e:
+                    problems.append((i, f'{self.name}: {value!r} ({e})'))
+        return changes
+
+
+@dataclass(frozen=True)
+class Schema:
+    """How to read the rows of a sheet into tuples, one value per column.
+
+    Header names are looked up once for the whole sheet, and each column is
+    checked and converted in one go. Every problem is reported at once, in a
+    SchemaError, rather than stopping at the first one.
+    """
+    sheet: str
+    columns: Tuple[Column, ...]
+    # Rows to leave out, given their values before they're converted.
+    skip: Optional[Callable[[Tuple], bool]] = None
+
+    def __post_init__(self):
+        if any(column.rest for column in self.columns[:-1]):
+            raise ValueError('only the last column can take the rest of a row')
+        SCHEMAS.append(self)
+
+    def fingerprint(self) -> str:
+        """Changes whenever the way this sheet is read does."""
+        skip = code_key(self.skip.__code__) if self.skip is not None else None
+        return fingerprint(self.sheet, self.columns, skip)
+
+    def indices(self, header: Sequence) -> List[int]:
+        header = [name.strip() if isinstance(name, str) else name
+                  for name in header]
+        indices = []
+        missing = []
+        for column in self.columns:
+            if column.index is not None:
+                indices.append(column.index)
+            elif column.name in header:
+                indices.append(header.index(column.name))
+            else:
+                missing.append(f'{self.sheet}: no {column.name!r} column')
+        if missing:
+            raise SchemaError(missing)
+        return indices
+
+    def read(self, workbook: Workbook) -> List[Tuple]:
+        sheet = workbook.sheet(self.sheet)
+        indices = self.indices(sheet[0] if sheet else ())
+        rest_index = indices.pop() if self.columns[-1].rest else None
+        width = max(indices, default=-1) + 1
+
+        body = [row + (None, ) * (width - len(row)) for row in sheet[1:]]
+        rows = [tuple(map(row.__getitem__, indices)) for row in body]
+        if rest_index is not None:
+            rows = [values + (row[rest_index:], )
+                    for values, row in zip(rows, body)]
+        # Numbered as they are in the spreadsheet, after its header.
+        numbered = [(row_number, row)
+                    for row_number, row in enumerate(rows, start=2)
+                    if self.skip is None or not self.skip(row)]
+        row_numbers = [row_number for row_number, _ in numbered]
+        rows = [row for _, row in numbered]
+
+        problems: List[Tuple[int, str]] = []
+        changes = []
+        for position, column in enumerate(self.columns):
+            if column.type is None and column.default is None:
+                continue
+            values = [row[position] for row in rows]
+            changes += [(i, position, value)
+                        for i, value in column.changes(values, problems)]
+        if problems:
+            raise SchemaError([
+                f'{self.sheet} row {row_numbers[i]}, {problem}'
+                for i, problem in sorted(problems)
+            ])
+        # Only the rows with something to change are rebuilt.
+        for i, position, value in changes:
+            row = rows[i]
+            rows[i] = row[:position] + (value, ) + row[position + 1:]
+        return rows
+
+
+def schemas_fingerprint() -> str:
+    return fingerprint([schema.fingerprint() for schema in SCHEMAS])
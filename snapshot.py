@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import dataclasses
+import io
+import pickle
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from build_manifest import code_key, fingerprint
+from card import Card, Element
+from disk_cache import file_digest
+from output_sink import write_atomically
+from schema import Column, Schema, schemas_fingerprint
+from util import gc_paused
+
+# Bump this whenever the snapshot's layout changes in a way the fingerprints
+# below wouldn't notice.
+SNAPSHOT_VERSION = 1
+
+
+@dataclass
+class CardDatabase:
+    """Everything read from the spreadsheet, before any of it is drawn."""
+    elements: Dict[str, Element]
+    card_types: Dict[str, List[Card]]
+    # The (name, description, back image, card class) of each deck.
+    decks: List[Tuple]
+
+    def restore(self) -> None:
+        """Make the elements the ones the rest of the code looks up."""
+        Element.restore(self.elements)
+
+
+def classes_fingerprint() -> str:
+    """Changes whenever the fields of the pickled classes do."""
+    classes = [Element, *Card.__subclasses__()]
+    return fingerprint([(cls.__name__, [(field.name, field.type)
+                                        for field in dataclasses.fields(cls)])
+                        for cls in classes])
+
+
+def loaders_fingerprint() -> str:
+    """Changes whenever the code that reads rows, or turns them into cards,
+    does."""
+    # Imported here, since deck saves and loads its decks through this module.
+    from deck import read_database
+    loaders = [('Schema.indices', Schema.indices), ('Schema.read', Schema.read),
+               ('Column.changes', Column.changes),
+               ('read_database', read_database),
+               ('Element', Element.load), ('Card', Card.load_card_types)]
+    loaders += [(cls.__name__, cls.load) for cls in Card.__subclasses__()]
+    return fingerprint([(name, code_key(loader.__code__))
+                        for name, loader in loaders])
+
+
+class Snapshot:
+    """The card database last read from a spreadsheet, pickled.
+
+    Reading the pickle back is much quicker than parsing the xlsx again. It's
+    only used if the spreadsheet's contents, the schemas it was read with, the
+    code that read its rows and made cards of them, and the card classes it
+    was read into are all the same as when it was saved. Otherwise it's ignored, and replaced
+    once the spreadsheet has been read.
+    """
+
+    def __init__(self, path: Path, force: bool = False):
+        self.path = Path(path)
+        # When forced, the spreadsheet is always read, but still saved.
+        self.force = force
+        self.status = 'not used'
+
+    def header(self, spreadsheet: Path) -> Dict[str, object]:
+        # First, since it imports deck, and with it the Decks schema.
+        loaders = loaders_fingerprint()
+        return {
+            'version': SNAPSHOT_VERSION,
+            'spreadsheet': file_digest(spreadsheet),
+            'schemas': schemas_fingerprint(),
+            'loaders': loaders,
+            'classes': classes_fingerprint(),
+        }
+
+    def load(self, spreadsheet: Path) -> Optional[CardDatabase]:
+        if self.force:
+            self.status = 'ignored, since the build is forced'
+            return None
+        start = time.perf_counter()
+        try:
+            with self.path.open('rb') as f:
+                header = pickle.load(f)
+                expected = self.header(spreadsheet)
+                # Only unpickle the cards if they'll fit the classes.
+                stale = [name for name in expected
+                         if header.get(name) != expected[name]]
+                if stale:
+                    self.status = f'out of date ({", ".join(stale)} changed)'
+                    return None
+                with gc_paused():
+                    database = pickle.load(f)
+        except FileNotFoundError:
+            self.status = 'not saved yet'
+            return None
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError,
+                ImportError, TypeError, ValueError) as e:
+            self.status = f'unreadable ({e!r})'
+            return None
+        seconds = time.perf_counter() - start
+        self.status = f'loaded from {self.path} in {seconds * 1000:.1f} ms'
+        return database
+
+    def save(self, spreadsheet: Path, database: CardDatabase) -> None:
+        start = time.perf_counter()
+        f = io.BytesIO()
+        pickle.dump(self.header(spreadsheet), f, pickle.HIGHEST_PROTOCOL)
+        pickle.dump(database, f, pickle.HIGHEST_PROTOCOL)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        write_atomically(self.path, f.getvalue())
+        seconds = time.perf_counter() - start
+        self.status += (f', saved {f.tell() / 2**10:.0f} KiB in '
+                        f'{seconds * 1000:.1f} ms')
+
+    def report(self) -> str:
+        return self.status
@@ -1,11 +1,17 @@
 from __future__ import annotations
-from dataclasses import dataclass, asdict, field
+from dataclasses import dataclass, asdict, field, fields
+import json
+from typing import Callable, ClassVar, Dict, List, Optional, TextIO, Tuple
 
 # NOTE: Member names are specifically set to reflect the Tabletop Simulator JSON format.
 # I know they're not how they should be named for normal Python classes.
 
 
 class Base:
+    # Objects holding a lot of others are written out piece by piece. The rest
+    # are small, and get encoded once and reused wherever they appear again.
+    streamed: ClassVar[bool] = False
+
     def to_json(self):
         return asdict(self)
 
@@ -25,11 +31,15 @@ class Transform(Base):
 
 @dataclass
 class Collection(Base):
+    streamed: ClassVar[bool] = True
+
     ObjectStates: List[Base]
 
 
 @dataclass
 class Deck(Base):
+    streamed: ClassVar[bool] = True
+
     Nickname: str
     Description: str
 
@@ -64,3 +74,81 @@ class Card(Base):
     SidewaysCard: bool = False
     Transform: Transform = field(default_factory=Transform)
     Tags: List[str] = field(default_factory=list)
+
+
+class JsonWriter:
+    """Writes objects as JSON without copying them into dicts first.
+
+    With an indent, the output is the same as `json.dump(obj.to_json(), f,
+    indent=indent)`. Without one it's as compact as possible.
+    """
+
+    def __init__(self, f: TextIO, indent: Optional[int] = None):
+        self.f = f
+        self.indent = indent
+        self.key_separator = ': ' if indent is not None else ':'
+        # Keyed on the object's id and nesting depth, since the indentation
+        # depends on both. The object is kept to stop its id being reused.
+        self._fragments: Dict[Tuple[int, int], Tuple[Base, str]] = {}
+        self._field_names: Dict[type, List[str]] = {}
+
+    def write(self, obj) -> None:
+        self._write(obj, 0, self.f.write)
+
+    def _newline(self, depth: int) -> str:
+        if self.indent is None:
+            return ''
+        return '\n' + ' ' * (self.indent * depth)
+
+    def _fragment(self, obj: Base, depth: int) -> str:
+        key = (id(obj), depth)
+        fragment = self._fragments.get(key)
+        if fragment is None:
+            parts = []
+            self._write_object(obj, depth, parts.append)
+            fragment = (obj, ''.join(parts))
+            self._fragments[key] = fragment
+        return fragment[1]
+
+    def _write(self, value, depth: int, write: Callable[[str], None]) -> None:
+        if isinstance(value, Base):
+            if value.streamed:
+                self._write_object(value, depth, write)
+            else:
+                write(self._fragment(value, depth))
+        elif isinstance(value, (list, tuple)):
+            self._write_items(((None, item) for item in value), depth, write,
+                              '[', ']')
+        elif isinstance(value, dict):
+            self._write_items(value.items(), depth, write, '{', '}')
+        else:
+            write(json.dumps(value))
+
+    def _write_object(self, obj: Base, depth: int,
+                      write: Callable[[str], None]) -> None:
+        names = self._field_names.get(type(obj))
+        if names is None:
+            names = [f.name for f in fields(obj)]
+            self._field_names[type(obj)] = names
+        self._write_items(((name, getattr(obj, name)) for name in names), depth,
+                          write, '{', '}')
+
+    def _write_items(self, items, depth: int, write: Callable[[str], None],
+                     open_bracket: str, close_bracket: str) -> None:
+        inner = self._newline(depth + 1)
+        separator = ','
+        first = True
+        for key, value in items:
+            write((open_bracket if first else separator) + inner)
+            if key is not None:
+                write(json.dumps(key) + self.key_separator)
+            self._write(value, depth + 1, write)
+            first = False
+        if first:
+            write(open_bracket + close_bracket)
+        else:
+            write(self._newline(depth) + close_bracket)
+
+
+def write_json(obj: Base, f: TextIO, indent: Optional[int] = None) -> None:
+    JsonWriter(f, indent).write(obj)
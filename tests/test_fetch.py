@@ -0,0 +1,131 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from fetch import SpreadsheetCache
+
+LAST_MODIFIED = 'Sat, 17 Oct 2026 00:00:00 GMT'
+
+
+class StandIn:
+    """A local server standing in for the spreadsheet export."""
+
+    def __init__(self):
+        self.body = b'first export'
+        self.etag = '"v1"'
+        self.last_modified = LAST_MODIFIED
+        # Whether to answer conditional requests with a 304 when we can.
+        self.honour_validators = True
+        self.status = 200
+        self.requests = []
+
+    def __call__(self, *args):
+        return Handler(self, *args)
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    def __init__(self, server_state: StandIn, *args):
+        self.state = server_state
+        super().__init__(*args)
+
+    def do_GET(self):
+        state = self.state
+        state.requests.append(dict(self.headers))
+        if state.status != 200:
+            self.send_error(state.status)
+            return
+        not_modified = (
+            (state.etag and self.headers.get('If-None-Match') == state.etag) or
+            (not state.etag and state.last_modified and
+             self.headers.get('If-Modified-Since') == state.last_modified))
+        if state.honour_validators and not_modified:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        if state.etag:
+            self.send_header('ETag', state.etag)
+        if state.last_modified:
+            self.send_header('Last-Modified', state.last_modified)
+        self.send_header('Content-Length', str(len(state.body)))
+        self.end_headers()
+        self.wfile.write(state.body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    state = StandIn()
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), state)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    state.url = f'http://127.0.0.1:{httpd.server_port}/export'
+    yield state
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_first_download(server, tmp_path):
+    fetched = SpreadsheetCache(tmp_path).fetch(server.url)
+
+    assert fetched.downloaded and fetched.changed
+    assert fetched.path.read_bytes() == b'first export'
+    assert 'If-None-Match' not in server.requests[0]
+    assert not list(tmp_path.glob('*.tmp'))
+
+
+def test_not_modified_by_etag(server, tmp_path):
+    first = SpreadsheetCache(tmp_path).fetch(server.url)
+    fetched = SpreadsheetCache(tmp_path).fetch(server.url)
+
+    assert server.requests[1]['If-None-Match'] == '"v1"'
+    assert not fetched.downloaded and not fetched.changed
+    assert fetched.digest == first.digest
+    assert fetched.path.read_bytes() == b'first export'
+
+
+def test_not_modified_since(server, tmp_path):
+    server.etag = None
+    SpreadsheetCache(tmp_path).fetch(server.url)
+    fetched = SpreadsheetCache(tmp_path).fetch(server.url)
+
+    assert server.requests[1]['If-Modified-Since'] == LAST_MODIFIED
+    assert 'If-None-Match' not in server.requests[1]
+    assert not fetched.downloaded and not fetched.changed
+
+
+def test_identical_body_sent_again(server, tmp_path):
+    SpreadsheetCache(tmp_path).fetch(server.url)
+    mtime = (tmp_path / 'spreadsheet.xlsx').stat().st_mtime_ns
+    server.honour_validators = False
+    fetched = SpreadsheetCache(tmp_path).fetch(server.url)
+
+    assert fetched.downloaded and not fetched.changed
+    # The copy we had is kept as it was.
+    assert fetched.path.stat().st_mtime_ns == mtime
+    assert not list(tmp_path.glob('*.tmp'))
+
+
+def test_changed_body(server, tmp_path):
+    first = SpreadsheetCache(tmp_path).fetch(server.url)
+    server.body = b'second export'
+    server.etag = '"v2"'
+    fetched = SpreadsheetCache(tmp_path).fetch(server.url)
+
+    assert fetched.downloaded and fetched.changed
+    assert fetched.digest != first.digest
+    assert fetched.path.read_bytes() == b'second export'
+
+
+def test_failed_download_keeps_the_last_copy(server, tmp_path):
+    SpreadsheetCache(tmp_path).fetch(server.url)
+    server.status = 500
+    with pytest.raises(requests.HTTPError):
+        SpreadsheetCache(tmp_path).fetch(server.url)
+
+    assert (tmp_path / 'spreadsheet.xlsx').read_bytes() == b'first export'
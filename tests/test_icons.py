@@ -0,0 +1,35 @@
+import pytest
+from PIL import Image
+
+import image_helper
+from card import Element, HiddenCard, ObstacleCard, RewardCard, RoleCard
+
+FIRE = Element('Fire', 'fire.svg')
+WATER = Element('Water', 'water.svg')
+EARTH = Element('Earth', 'earth.svg')
+
+CARDS = [
+    ObstacleCard('Flood', '', 1, [FIRE, WATER]),
+    RewardCard('Spring', '', 1, [WATER]),
+    RewardCard('Delta', '', 1, [FIRE, WATER, EARTH]),
+    RoleCard('Medic', 'Heals.', 1),
+    HiddenCard('???', '', 0),
+]
+
+
+@pytest.mark.parametrize('card', CARDS, ids=lambda card: card.name)
+@pytest.mark.parametrize('template', ['tts_template', 'game_crafter_template'])
+def test_requests_are_what_gets_drawn(card, template, monkeypatch):
+    template = getattr(card, template)()
+    drawn = set()
+
+    def svg2image(svg_path, width, height):
+        drawn.add((svg_path, width))
+        return Image.new('RGBA', (width, height))
+
+    monkeypatch.setattr(image_helper, 'svg2image', svg2image)
+    card.generate_image(Image.new('RGBA', (1000, 1000)),
+                        template.layout.image_box)
+
+    assert drawn
+    assert template.get_icon_requests(card) == drawn
@@ -0,0 +1,52 @@
+import builtins
+import os
+import stat
+
+import pytest
+
+import output_sink
+from output_sink import write_atomically
+
+
+@pytest.fixture
+def umask(monkeypatch):
+    old = os.umask(0o027)
+    monkeypatch.setattr(output_sink, '_umask', None)
+    yield 0o027
+    os.umask(old)
+
+
+def mode(path):
+    return stat.S_IMODE(path.stat().st_mode)
+
+
+def test_new_file_follows_the_umask(umask, tmp_path):
+    write_atomically(tmp_path / 'card.png', b'face')
+
+    assert (tmp_path / 'card.png').read_bytes() == b'face'
+    assert mode(tmp_path / 'card.png') == 0o640
+    assert not list(tmp_path.glob('*.tmp'))
+
+
+def test_replaced_file_keeps_its_mode(umask, tmp_path):
+    path = tmp_path / 'card.png'
+    path.write_bytes(b'old face')
+    path.chmod(0o604)
+    write_atomically(path, b'new face')
+
+    assert path.read_bytes() == b'new face'
+    assert mode(path) == 0o604
+
+
+def test_umask_without_proc(umask, monkeypatch):
+    real_open = builtins.open
+
+    def no_proc(name, *args, **kwargs):
+        if str(name).startswith('/proc/'):
+            raise FileNotFoundError(name)
+        return real_open(name, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, 'open', no_proc)
+
+    assert output_sink.current_umask() == 0o027
+    assert os.umask(0o027) == 0o027
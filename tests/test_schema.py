@@ -0,0 +1,94 @@
+import pytest
+
+from card import Card
+from schema import Column, Schema, SchemaError
+
+ROWS = Schema('Things', (
+    Column('Name'),
+    Column('Count', type=int),
+    Column('Note', default=''),
+    Column('Tags', 4, rest=True),
+), skip=lambda row: row[0] is None)
+
+
+class StandIn:
+    """Just enough of util.Workbook for the schemas."""
+
+    def __init__(self, **sheets):
+        self.sheets = sheets
+
+    def sheet(self, sheet_name):
+        return self.sheets[sheet_name]
+
+
+def test_columns_found_by_header():
+    header = ('Count', ' Name ', 'Note', None, 'Tag')
+
+    assert ROWS.indices(header) == [1, 0, 2, 4]
+
+
+def test_every_missing_column_reported():
+    with pytest.raises(SchemaError) as e:
+        ROWS.indices(('Name', ))
+
+    assert e.value.problems == [
+        "Things: no 'Count' column",
+        "Things: no 'Note' column",
+    ]
+
+
+def test_read():
+    workbook = StandIn(Things=[
+        ('Note', 'Name', 'Count', None, 'Tag'),
+        ('Loud', 'Horn', 2, None, 'a', 'b'),
+        (None, None, None),
+        (None, 'Bell', '3'),
+    ])
+
+    assert ROWS.read(workbook) == [
+        ('Horn', 2, 'Loud', ('a', 'b')),
+        ('Bell', 3, '', ()),
+    ]
+
+
+def test_every_problem_reported_at_once():
+    workbook = StandIn(Things=[
+        ('Name', 'Count', 'Note'),
+        ('Horn', 'two', None),
+        (None, 'skipped', None),
+        ('Bell', None, 'Quiet'),
+        ('Drum', 1, None),
+        ('Gong', '4.5', None),
+    ])
+
+    with pytest.raises(SchemaError) as e:
+        ROWS.read(workbook)
+
+    assert e.value.problems == [
+        "Things row 2, Count: 'two' (invalid literal for int() with base 10: 'two')",
+        'Things row 4, Count is empty',
+        "Things row 6, Count: '4.5' (invalid literal for int() with base 10: '4.5')",
+    ]
+
+
+def test_every_sheet_reported_at_once():
+    workbook = StandIn(
+        Elements=[('Name', 'Image', 'Count'), ('Fire', 'fire.svg', 'lots')],
+        Obstacles=[('Element', 'Element', 'Name', 'Description', 'Count'),
+                   ('Fire', 'Fire', 'Blaze', 'Hot.', None)],
+        Rewards=[('Name', 'Description', 'Count', 'Element')],
+        SpeciesRolesTrait=[(None, ) * 5 + ('Role', 'Description')],
+        MacGuffins=[('Name', 'Effect')],
+    )
+
+    with pytest.raises(SchemaError) as e:
+        Card.load_card_types(workbook)
+
+    assert e.value.problems == [
+        "Elements row 2, Count: 'lots' (invalid literal for int() with base 10: 'lots')",
+        'Obstacles row 2, Count is empty',
+        "MacGuffins: no 'Power Rating' column",
+        'MacGuffins: no "Ryan\'s Rating" column',
+        "MacGuffins: no 'Trigger' column",
+        "MacGuffins: no 'Before/After' column",
+    ]
@@ -0,0 +1,89 @@
+import pytest
+
+import snapshot
+from card import Element, RoleCard
+from schema import Column, Schema
+from snapshot import CardDatabase, Snapshot
+
+DATABASE = CardDatabase(
+    {'Fire': Element('Fire', 'fire.svg')},
+    {'RoleCard': [RoleCard('Medic', 'Heals.', 1)]},
+    [('Roles', 'Who you are.', 'back.png', 'RoleCard')],
+)
+
+
+@pytest.fixture
+def saved(tmp_path):
+    spreadsheet = tmp_path / 'spreadsheet.xlsx'
+    spreadsheet.write_bytes(b'first export')
+    Snapshot(tmp_path / 'cards.pickle').save(spreadsheet, DATABASE)
+    return spreadsheet
+
+
+def test_loaded_when_nothing_changed(saved, tmp_path):
+    cards = Snapshot(tmp_path / 'cards.pickle')
+
+    assert cards.load(saved) == DATABASE
+    assert cards.report().startswith('loaded from')
+
+
+def test_forced(saved, tmp_path):
+    assert Snapshot(tmp_path / 'cards.pickle', force=True).load(saved) is None
+
+
+def test_spreadsheet_changed(saved, tmp_path):
+    saved.write_bytes(b'second export')
+    cards = Snapshot(tmp_path / 'cards.pickle')
+
+    assert cards.load(saved) is None
+    assert cards.report() == 'out of date (spreadsheet changed)'
+
+
+def changed_read(self, workbook):
+    return []
+
+
+def changed_load(cls, workbook):
+    return []
+
+
+@pytest.mark.parametrize('owner, name, replacement', [
+    (Schema, 'read', changed_read),
+    (Schema, 'indices', changed_read),
+    (Column, 'changes', changed_read),
+    (RoleCard, 'load', classmethod(changed_load)),
+])
+def test_reader_changed(saved, tmp_path, monkeypatch, owner, name,
+                        replacement):
+    monkeypatch.setattr(owner, name, replacement)
+    cards = Snapshot(tmp_path / 'cards.pickle')
+
+    assert cards.load(saved) is None
+    assert cards.report() == 'out of date (loaders changed)'
+
+
+def test_read_database_changed(saved, tmp_path, monkeypatch):
+    monkeypatch.setattr('deck.read_database', changed_read)
+    cards = Snapshot(tmp_path / 'cards.pickle')
+
+    assert cards.load(saved) is None
+    assert cards.report() == 'out of date (loaders changed)'
+
+
+def test_version_changed(saved, tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshot, 'SNAPSHOT_VERSION',
+                        snapshot.SNAPSHOT_VERSION + 1)
+    cards = Snapshot(tmp_path / 'cards.pickle')
+
+    assert cards.load(saved) is None
+    assert cards.report() == 'out of date (version changed)'
+
+
+def test_class_changed(saved, tmp_path, monkeypatch):
+    monkeypatch.setattr(RoleCard, '__dataclass_fields__',
+                        {**RoleCard.__dataclass_fields__})
+    monkeypatch.delitem(RoleCard.__dataclass_fields__, 'description')
+    cards = Snapshot(tmp_path / 'cards.pickle')
+
+    assert cards.load(saved) is None
+    assert cards.report() == 'out of date (classes changed)'
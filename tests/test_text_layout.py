@@ -0,0 +1,86 @@
+import random
+import warnings
+from pathlib import Path
+
+import pytest
+from PIL.ImageFont import FreeTypeFont
+
+import card_template
+import fonts
+import text_layout
+
+FONT_PATHS = [
+    path for path in (card_template.FONT_PATH,
+                      '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+    if Path(path).exists()
+]
+
+WORDS = ('When an obstacle would be overcome, you may discard this MacGuffin '
+         'to instead return the obstacle to the top of the deck and draw two '
+         'reward cards. AVA Toff LTA fi ff W. Y, T-shirt').split()
+
+pytestmark = [
+    pytest.mark.skipif(not FONT_PATHS, reason='no fonts to measure with'),
+    pytest.mark.skipif(not hasattr(FreeTypeFont, 'getsize'),
+                       reason='the old wrapping needs FreeTypeFont.getsize'),
+]
+
+
+def legacy_text_wrap(text, font, max_width):
+    # util.text_wrap as it was, without the trailing space on each line.
+    lines = []
+    if callable(max_width):
+        max_width_func = max_width
+    else:
+        max_width_func = lambda x: max_width
+
+    if font.getsize(text)[0] <= max_width_func(0):
+        return [text]
+    words = text.split(' ')
+    i = 0
+    while i < len(words):
+        line = ''
+        while i < len(words) and font.getsize(line + words[i])[0] <= max_width_func(len(lines)):
+            line = line + words[i] + ' '
+            i += 1
+        if not line:
+            line = words[i] + ' '
+            i += 1
+        lines.append(line[:-1])
+    return lines
+
+
+def random_text(rng: random.Random) -> str:
+    words = []
+    for _ in range(rng.randrange(1, 40)):
+        if rng.random() < 0.8:
+            words.append(rng.choice(WORDS))
+        else:
+            words.append(''.join(
+                rng.choice('AVWTfiolj.,-') for _ in range(rng.randrange(1, 9))))
+    return ' '.join(words)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_wrap_breaks_lines_like_the_old_text_wrap(seed):
+    rng = random.Random(seed)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', DeprecationWarning)
+        for _ in range(100):
+            font = fonts.get_font(rng.choice(FONT_PATHS), rng.randrange(8, 90))
+            text = random_text(rng)
+            max_width = rng.uniform(20, 900)
+            if rng.random() < 0.2:
+                # Narrowing lines, like CircleDeckTemplate's.
+                max_width = lambda line_num, top=max_width: top * (1 - 0.03 * line_num)
+            assert (list(text_layout.wrap(text, font, max_width).lines) ==
+                    legacy_text_wrap(text, font, max_width)), (text, font.size)
+
+
+def test_wrap_measures_lines_by_their_ink():
+    font = fonts.get_font(FONT_PATHS[0], 40)
+    layout = text_layout.wrap(' '.join(WORDS), font, 300)
+    for line, width in zip(layout.lines, layout.widths):
+        # Estimated widths are only kept when well within the limit.
+        assert width <= 300 or ' ' not in line
+        assert abs(width - text_layout.ink_width(font, line)) <= font.size
@@ -0,0 +1,256 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Callable, Dict, Hashable, List, Tuple, Union
+
+from PIL import ImageDraw
+from PIL.ImageFont import FreeTypeFont
+
+import fonts
+
+MaxWidth = Union[float, Callable[[int], float]]
+
+# Kerning and rounding can make a joined line a little wider or narrower than
+# its words add up to. Lines whose estimated width is within this fraction of
+# the font size (per word), plus a couple of pixels, of the limit get measured
+# exactly instead.
+KERNING_SLACK = 0.02
+ROUNDING_SLACK = 2
+
+
+def ink_width(font: FreeTypeFont, text: str) -> int:
+    """The width of the box around the drawn text.
+
+    This is what the old FreeTypeFont.getsize measured, so lines break in the
+    same places they always have.
+    """
+    left, _, right, _ = font.getbbox(text, 'L')
+    return right - left
+
+
+class WordWidths:
+    """Caches the advance and ink extents of each word drawn in a font."""
+
+    def __init__(self, font: FreeTypeFont, spacing: int = 4):
+        self.font = font
+        self.space = font.getlength(' ')
+        # Same spacing that ImageDraw.multiline_text puts between lines.
+        self.line_spacing = font.getbbox('A')[3] + spacing
+        self.slack = font.size * KERNING_SLACK
+        self._extents: Dict[str, Tuple[float, int, int]] = {}
+
+    def extents(self, word: str) -> Tuple[float, int, int]:
+        """The advance of a word, and where its ink starts and ends."""
+        extents = self._extents.get(word)
+        if extents is None:
+            left, _, right, _ = self.font.getbbox(word, 'L')
+            extents = (self.font.getlength(word), left, right)
+            self._extents[word] = extents
+        return extents
+
+    def estimate(self, words: List[str]) -> float:
+        """Roughly the ink width of the words joined with spaces."""
+        _, left, _ = self.extents(words[0])
+        _, _, right = self.extents(words[-1])
+        advances = sum(self.extents(word)[0] for word in words[:-1])
+        return advances + self.space * (len(words) - 1) + right - left
+
+    def fits(self, words: List[str], estimate: float,
+             max_width: float) -> Tuple[bool, float]:
+        slack = self.slack * len(words) + ROUNDING_SLACK
+        if estimate <= max_width - slack:
+            return True, estimate
+        if estimate > max_width + slack:
+            return False, estimate
+        width = ink_width(self.font, ' '.join(words))
+        return width <= max_width, width
+
+
+_WORD_WIDTHS: Dict[Tuple[str, int], WordWidths] = {}
+
+
+def word_widths(font: FreeTypeFont) -> WordWidths:
+    key = (font.path, font.size)
+    widths = _WORD_WIDTHS.get(key)
+    if widths is None:
+        widths = WordWidths(font)
+        _WORD_WIDTHS[key] = widths
+    return widths
+
+
+@dataclass(frozen=True)
+class TextLayout:
+    lines: Tuple[str, ...]
+    widths: Tuple[float, ...]
+    line_spacing: int
+
+    @property
+    def width(self) -> float:
+        return max(self.widths, default=0)
+
+    @property
+    def height(self) -> int:
+        return self.line_spacing * len(self.lines)
+
+    @property
+    def text(self) -> str:
+        return '\n'.join(self.lines)
+
+
+def wrap(text: str, font: FreeTypeFont, max_width: MaxWidth) -> TextLayout:
+    """Break text into lines that each fit within `max_width`.
+
+    `max_width` is either a width or a function of the line number, for boxes
+    that aren't rectangular. Words are only broken at spaces, so a word wider
+    than the line gets a line to itself.
+    """
+    if callable(max_width):
+        max_width_func = max_width
+    else:
+        max_width_func = lambda line_num: max_width
+
+    widths = word_widths(font)
+    lines = []
+    line_widths = []
+    for paragraph in text.split('\n'):
+        words = paragraph.split(' ')
+        # A paragraph that fits is never broken, even if a shorter line would
+        # not have fitted, which kerning can make happen.
+        fits, width = widths.fits(words, widths.estimate(words),
+                                  max_width_func(len(lines)))
+        if fits:
+            lines.append(paragraph)
+            line_widths.append(width)
+            continue
+
+        i = 0
+        while i < len(words):
+            limit = max_width_func(len(lines))
+            line = [words[i]]
+            advance, left, right = widths.extents(words[i])
+            line_width = right - left
+            i += 1
+            while i < len(words):
+                word_advance, _, word_right = widths.extents(words[i])
+                estimate = advance + widths.space + word_right - left
+                fits, width = widths.fits(line + [words[i]], estimate, limit)
+                if not fits:
+                    break
+                line.append(words[i])
+                advance += widths.space + word_advance
+                line_width = width
+                i += 1
+            lines.append(' '.join(line))
+            line_widths.append(line_width)
+
+    return TextLayout(tuple(lines), tuple(line_widths), widths.line_spacing)
+
+
+def draw_text(draw: ImageDraw, xy: Tuple[float, float], layout: TextLayout,
+              font: FreeTypeFont, fill, anchor: str) -> None:
+    """Draw centred lines the same way ImageDraw.multiline_text would.
+
+    With centre alignment each line is simply drawn at `xy` with the given
+    anchor, so the line widths never need to be measured again.
+    """
+    x, top = xy
+    if anchor[1] == 'm':
+        top -= (len(layout.lines) - 1) * layout.line_spacing / 2.0
+    elif anchor[1] == 'd':
+        top -= (len(layout.lines) - 1) * layout.line_spacing
+
+    for line in layout.lines:
+        draw.text((x, top), line, fill=fill, font=font, anchor=anchor)
+        top += layout.line_spacing
+
+
+@dataclass(frozen=True)
+class Fit:
+    size: int
+    layout: TextLayout
+
+
+_FITS: Dict[Hashable, Fit] = {}
+
+
+def clear_fit_cache() -> None:
+    _FITS.clear()
+
+
+def _fit(key: Hashable, max_size: int, min_size: int,
+         layout_at: Callable[[int], Tuple[TextLayout, bool]]) -> Fit:
+    fit = _FITS.get(key)
+    if fit is not None:
+        return fit
+
+    layout, fits = layout_at(max_size)
+    best = Fit(max_size, layout)
+    if not fits:
+        # Binary search for the largest size that fits. If nothing does, we
+        # settle for the smallest size we're allowed.
+        best = Fit(min_size, layout_at(min_size)[0])
+        low, high = min_size + 1, max_size - 1
+        while low <= high:
+            size = (low + high) // 2
+            layout, fits = layout_at(size)
+            if fits:
+                best = Fit(size, layout)
+                low = size + 1
+            else:
+                high = size - 1
+
+    _FITS[key] = best
+    return best
+
+
+def fit_line(key: Hashable,
+             text: str,
+             font_path: str,
+             max_width: float,
+             max_size: int,
+             min_size: int = 1) -> Fit:
+    """Find the largest font size that fits `text` on one line.
+
+    `key` identifies the box being filled, e.g. the template and its bbox.
+    Results are cached on it along with the text and the size limits.
+    """
+
+    def layout_at(size: int) -> Tuple[TextLayout, bool]:
+        font = fonts.get_font(font_path, size)
+        _, _, width, _ = font.getbbox(text)
+        layout = TextLayout((text, ), (width, ), word_widths(font).line_spacing)
+        return layout, width <= max_width
+
+    return _fit(('line', key, text, font_path, max_size, min_size), max_size,
+                min_size, layout_at)
+
+
+def fit_text(key: Hashable,
+             text: str,
+             font_path: str,
+             max_width: Callable[[FreeTypeFont], MaxWidth],
+             max_height: float,
+             max_size: int,
+             min_size: int = 1) -> Fit:
+    """Find the largest font size at which wrapped `text` fits in a box.
+
+    `max_width` is given the font being tried, and returns the line width (or
+    per-line width function) to wrap with at that size. Every line has to fit
+    within its width, and all of the lines within `max_height`.
+    """
+
+    def layout_at(size: int) -> Tuple[TextLayout, bool]:
+        font = fonts.get_font(font_path, size)
+        limit = max_width(font)
+        layout = wrap(text, font, limit)
+        if callable(limit):
+            limits = [limit(line_num) for line_num in range(len(layout.lines))]
+        else:
+            limits = [limit] * len(layout.lines)
+        fits = (layout.height <= max_height and all(
+            width <= line_limit
+            for width, line_limit in zip(layout.widths, limits)))
+        return layout, fits
+
+    return _fit(('text', key, text, font_path, max_height, max_size, min_size),
+                max_size, min_size, layout_at)
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import functools
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, ContextManager, Dict, Iterator, List, Optional, TypeVar
+
+F = TypeVar('F', bound=Callable)
+
+# Nothing is recorded unless a tracer has been configured.
+TRACER: Optional[Tracer] = None
+
+_NOT_TRACING = nullcontext()
+
+
+@dataclass
+class Span:
+    name: str
+    category: str
+    start_ns: int
+    duration_ns: int
+    pid: int
+    tid: int
+    args: Dict[str, object] = field(default_factory=dict)
+
+    @property
+    def milliseconds(self) -> float:
+        return self.duration_ns / 1e6
+
+
+class Tracer:
+    """Records how long each span of a build took.
+
+    The spans can be saved in the Chrome trace format, to be opened in
+    chrome://tracing or https://ui.perfetto.dev.
+    """
+
+    def __init__(self):
+        self.spans: List[Span] = []
+
+    @contextmanager
+    def span(self, name: str, category: str,
+             args: Dict[str, object]) -> Iterator[None]:
+        # perf_counter is the system-wide monotonic clock, so spans from the
+        # render workers line up with the ones from this process.
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.spans.append(
+                Span(name, category, start,
+                     time.perf_counter_ns() - start, os.getpid(),
+                     threading.get_native_id(), args))
+
+    def to_chrome(self) -> Dict[str, object]:
+        events = [{
+            'name': span.name,
+            'cat': span.category,
+            'ph': 'X',
+            'ts': span.start_ns / 1000,
+            'dur': span.duration_ns / 1000,
+            'pid': span.pid,
+            'tid': span.tid,
+            'args': span.args,
+        } for span in self.spans]
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def save(self, path: Path) -> None:
+        Path(path).write_text(json.dumps(self.to_chrome(), default=str))
+
+    def summary(self, top: int = 10) -> str:
+        cards = [span for span in self.spans if span.category == 'card']
+        lines = [f'Slowest {min(top, len(cards))} cards:']
+        for span in sorted(cards, key=lambda s: s.duration_ns,
+                           reverse=True)[:top]:
+            lines.append(f'  {span.milliseconds:8.1f} ms  {span.name:<32} '
+                         f'{span.args.get("card")}')
+
+        lines.append('Templates:')
+        lines.extend(self._totals(cards))
+        lines.append('Everything else:')
+        lines.extend(
+            self._totals(span for span in self.spans
+                         if span.category != 'card')[:top])
+        return '\n'.join(lines)
+
+    @staticmethod
+    def _totals(spans) -> List[str]:
+        durations: Dict[str, List[float]] = defaultdict(list)
+        for span in spans:
+            durations[span.name].append(span.milliseconds)
+        totals = sorted(durations.items(),
+                        key=lambda item: sum(item[1]),
+                        reverse=True)
+        return [
+            f'  {sum(ms):8.1f} ms  {name:<32} {len(ms):5} calls, '
+            f'{sum(ms) / len(ms):.2f} ms mean, {max(ms):.2f} ms max'
+            for name, ms in totals
+        ]
+
+
+def configure(tracer: Optional[Tracer]) -> None:
+    global TRACER
+    TRACER = tracer
+
+
+def span(name: str, category: str = 'build',
+         **args) -> ContextManager[None]:
+    """Time the body of a `with` block, if tracing is on."""
+    if TRACER is None:
+        return _NOT_TRACING
+    return TRACER.span(name, category, args)
+
+
+def traced(category: str = 'build',
+           name: Optional[str] = None) -> Callable[[F], F]:
+    """Decorate a function so every call to it is a span."""
+
+    def decorator(func: F) -> F:
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if TRACER is None:
+                return func(*args, **kwargs)
+            with TRACER.span(span_name, category, {}):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -1,71 +1,68 @@
+from __future__ import annotations
+
 from contextlib import contextmanager
-from typing import ContextManager, Dict, List
+from typing import Dict, Iterator, List, Tuple
 from pathlib import Path
+import gc
 import itertools
+import time
 
 import openpyxl
 
-def text_wrap(text, font, max_width):
-    """Wrap text base on specified width.
-        This is to enable text of width more than the image width to be display
-        nicely.
-        @params:
-            text: str
-                text to wrap
-            font: obj
-                font of the text
-            max_width: int
-                width to split the text with
-        @return
-            lines: list[str]
-                list of sub-strings
-        """
-    lines = []
-
-    if callable(max_width):
-        max_width_func = max_width
-    else:
-        max_width_func = lambda x: max_width
-
-    # If the text width is smaller than the image width, then no need to split
-    # just add it to the line list and return
-    if font.getsize(text)[0] <= max_width_func(0):
-        lines.append(text)
-    else:
-        #split the line by spaces to get words
-        words = text.split(' ')
-        i = 0
-        # append every word to a line while its width is shorter than the image width
-        while i < len(words):
-            line = ''
-            while i < len(words) and font.getsize(line +
-                                                  words[i])[0] <= max_width_func(len(lines)):
-                line = line + words[i] + " "
-                i += 1
-            if not line:
-                line = words[i]
-                i += 1
-            lines.append(line)
-    return '\n'.join(lines)
+
+class Workbook:
+    """A spreadsheet opened once and shared by all of the loaders.
+
+    Each worksheet is parsed the first time it is asked for, and its rows are
+    kept so that later loaders reading the same sheet don't parse it again.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.timings: Dict[str, float] = {}
+        self._wb = openpyxl.load_workbook(str(path), read_only=True)
+        self._rows: Dict[str, List[Tuple]] = {}
+
+    def __enter__(self) -> Workbook:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._wb.close()
+
+    def sheet(self, sheet_name: str) -> List[Tuple]:
+        if sheet_name not in self._rows:
+            start = time.perf_counter()
+            rows = list(self._wb[sheet_name].iter_rows(values_only=True))
+            self.timings[sheet_name] = time.perf_counter() - start
+            self._rows[sheet_name] = rows
+        return self._rows[sheet_name]
+
+    def report(self) -> str:
+        lines = [f'Loaded {self.path}:']
+        for sheet_name, seconds in self.timings.items():
+            lines.append(f'  {sheet_name}: {seconds * 1000:.1f} ms')
+        lines.append(f'  total: {sum(self.timings.values()) * 1000:.1f} ms')
+        return '\n'.join(lines)
+
 
 @contextmanager
-def spreadsheet(path: Path) -> ContextManager[openpyxl.Workbook]:
-    wb = openpyxl.load_workbook(str(path), read_only=True)
+def gc_paused() -> Iterator[None]:
+    """Pause the cyclic garbage collector inside the `with` block.
+
+    Building lots of objects that all stay alive, like every card in a long
+    spreadsheet, otherwise sets off collections that scan them over and over
+    to find nothing.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
     try:
-        yield wb
+        yield
     finally:
-        wb.close()
-
-
-def spreadsheet_as_dicts(path: Path, sheet_name: str) -> List[Dict[str, str]]:
-    with spreadsheet(path) as wb:
-        sheet = wb[sheet_name]
-        rows = sheet.iter_rows()
-        header = [cell.value for cell in next(rows)]
-        for row in rows:
-            yield dict(
-                itertools.zip_longest(header, [cell.value for cell in row],
-                                      fillvalue=''))
+        if enabled:
+            gc.enable()
 
 
 def grouper(iterable, n, fillvalue=None):
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import time
+import traceback
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+import image_helper
+
+# Modification time and size, which change whenever a file is saved.
+Stamp = Tuple[int, int]
+
+
+def scan(spreadsheet: Path, icon_dir: Path) -> Dict[Path, Stamp]:
+    stamps = {}
+    for path in [spreadsheet, *sorted(icon_dir.glob('*.svg'))]:
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            # Some editors delete the file before writing the new one.
+            continue
+        stamps[path] = (stat.st_mtime_ns, stat.st_size)
+    return stamps
+
+
+class Watcher:
+    """Polls the spreadsheet and icons for changes."""
+
+    def __init__(self,
+                 spreadsheet: Path,
+                 icon_dir: Path = image_helper.ICON_DIR,
+                 interval: float = 1.0):
+        self.spreadsheet = spreadsheet
+        self.icon_dir = icon_dir
+        self.interval = interval
+        self.stamps = scan(spreadsheet, icon_dir)
+
+    def poll(self) -> List[Path]:
+        """The files that have been added, changed or removed since last time."""
+        stamps = scan(self.spreadsheet, self.icon_dir)
+        changed = [
+            path for path in stamps.keys() | self.stamps.keys()
+            if stamps.get(path) != self.stamps.get(path)
+        ]
+        self.stamps = stamps
+        return sorted(changed)
+
+    def wait(self) -> List[Path]:
+        """Wait for something to change, and then to stop changing."""
+        changed = []
+        while not changed:
+            time.sleep(self.interval)
+            changed = self.poll()
+        # Let a save that's still being written finish first.
+        while True:
+            time.sleep(self.interval)
+            more = self.poll()
+            if not more:
+                return changed
+            changed = sorted(set(changed) | set(more))
+
+    def saved_at(self, paths: List[Path]) -> float:
+        """When the newest of these files was saved, as a time.time()."""
+        stamps = [self.stamps[path][0] for path in paths if path in self.stamps]
+        return max(stamps) / 1e9 if stamps else time.time()
+
+
+def invalidate(changed: List[Path]) -> None:
+    """Forget anything cached in memory that was made from these files."""
+    icons = [path for path in changed if path.suffix == '.svg']
+    if icons:
+        dropped = image_helper.ICON_CACHE.discard(icons)
+        print(f'Dropped {dropped} cached sizes of {len(icons)} changed icons.')
+
+
+def watch(watcher: Watcher, build: Callable[[], None]) -> None:
+    """Build, then build again every time the watched files change.
+
+    Everything cached in memory stays warm between builds, apart from what
+    was made from the files that changed. A failed build is reported, and
+    the next change is waited for as usual.
+    """
+
+    def try_build() -> bool:
+        try:
+            build()
+            return True
+        except Exception:
+            traceback.print_exc()
+            return False
+
+    try_build()
+    while True:
+        print(f'Watching {watcher.spreadsheet} and {watcher.icon_dir} '
+              'for changes.')
+        changed = watcher.wait()
+        saved_at = watcher.saved_at(changed)
+        print('Changed: ' + ', '.join(str(path) for path in changed))
+
+        start = time.perf_counter()
+        invalidate(changed)
+        succeeded = try_build()
+        seconds = time.perf_counter() - start
+        status = 'Rebuilt' if succeeded else 'Failed'
+        print(f'{status} in {seconds:.2f} s, '
+              f'{time.time() - saved_at:.2f} s after the change was saved.')